@@ -0,0 +1,287 @@
+#offline benchmark of the game loop, the renderer and its PNG backends on synthetic maps, saved as JSON
+
+import argparse
+import io
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from game_map import Map, ROSTER_NAMES
+from map_generator import scaled_map
+from utils import calculate_advantage, calculate_advantage_batch, update_map
+import main
+
+DEFAULT_SIZES = ["7x13", "50x50", "100x100", "250x250", "500x500"]
+DEFAULT_FRAGMENTATION = [0.0, 0.1, 0.5]
+# a 500x500 board is a 32000x32000 px frame, so renderers are only timed up to this many cells
+DEFAULT_RENDER_MAX_CELLS = 100 * 100
+# how long a fresh interpreter may take to import each headless entry point (seconds, median of runs)
+STARTUP_BUDGET_S = {"main": 0.4, "simulation": 0.4}
+# the fresh interpreters timed by measure_startup import the modules from here, wherever this is run from
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic_map(height, width, fragmentation=0.0, seed=0):
+    # the real roster layout scaled onto height x width, then a fraction of the cells
+    # handed to random characters to break territories up
+    base = scaled_map(height, width)
+    grid = base.grid.copy()
+
+    rng = np.random.default_rng(seed)
+    scattered = rng.random(grid.shape) < fragmentation
+    grid[scattered] = rng.integers(1, len(ROSTER_NAMES), size=int(scattered.sum()))
+    return Map(grid, base.names)
+
+
+def random_battle(game_map, rng):
+    # an attacker tile and one of its neighbours, like main.step picks them
+    while True:
+        attacker = game_map.name_of(game_map.ledger.sample(rng))
+        opponents = main.find_surrounding_players(game_map, attacker)
+        if opponents:
+            return attacker, rng.choice(opponents)
+
+
+def make_cases(game_map, seed, render):
+    # each case is (name, setup) where setup() returns a zero-argument callable to time
+    def bench_update_map():
+        state = game_map.copy()
+        rng = random.Random(seed)
+
+        def run():
+            nonlocal state
+            if state.ledger.winner() is not None:
+                state = game_map.copy()
+            winner, loser = random_battle(state, rng)
+            update_map(state, winner, loser, state.count(loser))
+        return run
+
+    def bench_calculate_advantage():
+        rng = random.Random(seed)
+        pairs = [(rng.randint(1, game_map.grid.size), rng.randint(1, game_map.grid.size)) for _ in range(1000)]
+
+        def run():
+            for attacking, defending in pairs:
+                calculate_advantage(attacking, defending)
+        return run
+
+    def bench_calculate_advantage_batch():
+        rng = np.random.default_rng(seed)
+        attacking, defending = rng.integers(1, game_map.grid.size + 1, size=(2, 1000))
+
+        def run():
+            calculate_advantage_batch(attacking, defending)
+        return run
+
+    def bench_step():
+        state = game_map.copy()
+        rng = random.Random(seed)
+
+        def run():
+            nonlocal state
+            if state.ledger.winner() is not None:
+                state = game_map.copy()
+            state, _ = main.step(state, simulate=True, rng=rng, verbose=False)
+        return run
+
+    def bench_find_surrounding_players():
+        rng = random.Random(seed)
+        players = [game_map.name_of(p) for p in game_map.players()]
+
+        def run():
+            main.find_surrounding_players(game_map, rng.choice(players))
+        return run
+
+    def bench_render():
+        rng = random.Random(seed)
+        players = [game_map.name_of(p) for p in game_map.players()]
+        renderer = MapRenderer()
+
+        def run():
+            attacker, defender = rng.sample(players, 2) if len(players) > 1 else (None, None)
+            renderer.render(game_map, attacker=attacker, defender=defender)
+        return run
+
+    def bench_encode_png(backend):
+        def setup():
+            frame = MapRenderer().render(game_map).copy()
+
+            def run():
+                backend.encode_png(frame)
+            return run
+        return setup
+
+    cases = [
+        ("update_map", bench_update_map),
+        ("calculate_advantage_x1000", bench_calculate_advantage),
+        ("calculate_advantage_batch_x1000", bench_calculate_advantage_batch),
+        ("step", bench_step),
+        ("find_surrounding_players", bench_find_surrounding_players),
+    ]
+    if render:
+        from rendering import MapRenderer
+        from render_backends import available_backends
+        cases.append(("render", bench_render))
+        for name, backend in available_backends().items():
+            cases.append((f"encode_png_{name}", bench_encode_png(backend)))
+    return cases
+
+
+def time_case(setup, min_time, max_ops):
+    run = setup()
+    run()  # warm up caches (icon atlas, first full frame)
+    ops = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time and ops < max_ops:
+        run()
+        ops += 1
+        elapsed = time.perf_counter() - start
+    return ops / elapsed, elapsed / ops
+
+
+def peak_memory(setup, ops=3):
+    run = setup()
+    run()
+    tracemalloc.start()
+    try:
+        for _ in range(ops):
+            run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_startup(module, repeats=5):
+    # wall time for a fresh interpreter to import module, median of several runs
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True, cwd=REPO_DIR,
+                       env={**os.environ, "SMASH_HEADLESS": "1"})
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def startup_report(budgets=STARTUP_BUDGET_S):
+    report = []
+    for module, budget in budgets.items():
+        seconds = measure_startup(module)
+        report.append({"module": module, "seconds": seconds, "budget_s": budget, "within_budget": seconds <= budget})
+        print(f"import {module:22} {seconds * 1000:10.1f} ms (budget {budget * 1000:.0f} ms)"
+              f"{'' if seconds <= budget else '  OVER BUDGET'}")
+    return report
+
+
+def backend_report():
+    # which render backend this machine would pick at startup, and why
+    import render_backends
+    render_backends.select_backend()
+    report = dict(render_backends.selection)
+    timings = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in report["seconds_per_frame"].items())
+    print(f"render backend: {report['backend']} ({timings}{', cached' if report['cached'] else ''})")
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=REPO_DIR).stdout.strip()
+    except OSError:
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, fragmentation=DEFAULT_FRAGMENTATION, seed=0, min_time=0.5, max_ops=10000,
+                   render=True, render_max_cells=DEFAULT_RENDER_MAX_CELLS, only=None):
+    startup = startup_report()
+    backend = backend_report() if render else None
+    results = []
+    for size in sizes:
+        height, width = (int(n) for n in size.split("x"))
+        for frag in fragmentation:
+            game_map = synthetic_map(height, width, frag, seed)
+            live = len(game_map.players())
+            render_here = render and height * width <= render_max_cells
+            for name, setup in make_cases(game_map, seed, render_here):
+                if only and name not in only:
+                    continue
+                # silence the game's own prints while timing
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ops_per_sec, sec_per_op = time_case(setup, min_time, max_ops)
+                    peak = peak_memory(setup)
+                result = {
+                    "case": name,
+                    "size": size,
+                    "fragmentation": frag,
+                    "players": live,
+                    "ops_per_sec": ops_per_sec,
+                    "ms_per_op": sec_per_op * 1000,
+                    "peak_memory_bytes": peak,
+                }
+                results.append(result)
+                print(f"{name:32} {size:>9} frag={frag:<4} {ops_per_sec:12.1f} ops/s {peak / 1e6:10.2f} MB peak")
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "seed": seed,
+        "startup": startup,
+        "render_backend": backend,
+        "results": results,
+    }
+
+
+def compare(current, previous):
+    # ops/sec ratio against an earlier run, per matching (case, size, fragmentation)
+    key = lambda r: (r["case"], r["size"], r["fragmentation"])
+    old = {key(r): r for r in previous["results"]}
+    print(f"\nCompared with {previous.get('commit')} ({previous.get('timestamp')}):")
+    for result in current["results"]:
+        before = old.get(key(result))
+        if before:
+            ratio = result["ops_per_sec"] / before["ops_per_sec"]
+            print(f"{result['case']:32} {result['size']:>9} frag={result['fragmentation']:<4} x{ratio:.2f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the game engine and renderers.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="board sizes as HxW")
+    parser.add_argument("--fragmentation", nargs="+", type=float, default=DEFAULT_FRAGMENTATION,
+                        help="fraction of cells scattered to random characters")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to time each case for")
+    parser.add_argument("--max-ops", type=int, default=10000)
+    parser.add_argument("--no-render", action="store_true", help="skip the rendering and PNG encoding cases")
+    parser.add_argument("--render-max-cells", type=int, default=DEFAULT_RENDER_MAX_CELLS)
+    parser.add_argument("--only", nargs="+", default=None, help="only run these cases")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="an earlier results JSON to compare against")
+    parser.add_argument("--check-startup", action="store_true", help="exit with an error if an import is over budget")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.fragmentation, args.seed, args.min_time, args.max_ops,
+                            not args.no_render, args.render_max_cells, args.only)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+    if args.check_startup and not all(entry["within_budget"] for entry in report["startup"]):
+        sys.exit("startup budget exceeded")
+
+
+if __name__ == "__main__":
+    main_cli()
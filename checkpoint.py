@@ -0,0 +1,55 @@
+#snapshots of a game in progress: the board, the round number and the rng state, so a long run can be
+#resumed after a crash or forked into what-if continuations without replaying it from round 0.
+#A checkpoint is a map file (game_map.save_map) with extra fields, so anything that loads maps loads one.
+
+import os
+import random
+
+import numpy as np
+
+from game_map import Map, as_map
+
+
+def save_checkpoint(path, map, round_number, rng=None):
+    # rng is the random.Random driving the game; None (e.g. a game played by hand) stores no rng state.
+    # path can also be an open binary file. A file name is written to a temporary file first, so a crash
+    # mid-write never leaves a truncated checkpoint.
+    game_map = as_map(map)
+    fields = {"grid": game_map.grid, "names": np.array(game_map.names), "round": np.int64(round_number)}
+    if rng is not None:
+        version, internal, gauss_next = rng.getstate()
+        fields["rng_version"] = np.int64(version)
+        fields["rng_state"] = np.array(internal, dtype=np.uint64)
+        fields["rng_gauss"] = np.float64(np.nan if gauss_next is None else gauss_next)
+
+    if not isinstance(path, (str, os.PathLike)):
+        np.savez_compressed(path, **fields)
+        return
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez_compressed(f, **fields)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    # (Map, round number, random.Random restored to where the game left off). path can be a file name
+    # or an open binary file; a plain map file loads as round 0 with no rng (None).
+    with np.load(path, allow_pickle=False) as data:
+        game_map = Map(data["grid"], data["names"].tolist())
+        round_number = int(data["round"]) if "round" in data else 0
+        rng = None
+        if "rng_state" in data:
+            gauss_next = float(data["rng_gauss"])
+            rng = random.Random()
+            rng.setstate((int(data["rng_version"]), tuple(data["rng_state"].tolist()),
+                          None if np.isnan(gauss_next) else gauss_next))
+    return game_map, round_number, rng
+
+
+def fork(path, seed):
+    # the checkpointed position with a fresh rng: one what-if continuation per seed
+    game_map, round_number, _ = load_checkpoint(path)
+    return game_map, round_number, random.Random(seed)
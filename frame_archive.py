@@ -0,0 +1,175 @@
+#games stored as tile-id grids rather than pictures: a frame is fully determined by who owns each cell,
+#so an archive is a game_history.GameHistory (a keyframe grid now and then plus the cells that changed
+#hands each round) and the name table, and the icon atlas turns it back into pixels only when exporting to
+#GIF, APNG or MP4. Recording needs only numpy, so main.py can archive without loading any imaging library.
+
+import argparse
+import os
+
+import numpy as np
+
+from game_history import NO_PLAYER, GameHistory
+from game_map import as_map
+from icon_atlas import ICON_SIZE, LOD_TILE_SIZES, compose_frame, downsample_atlas, icon_atlas
+
+# a full grid is kept this often, so reading one frame replays at most this many rounds
+ARCHIVE_KEYFRAME_INTERVAL = 250
+
+
+class FrameArchive:
+    def __init__(self, names, history=None, keyframe_interval=ARCHIVE_KEYFRAME_INTERVAL, start_round=0):
+        # start_round is the game's round number at the first board appended (a resumed checkpoint's round)
+        self.names = list(names)
+        self.keyframe_interval = keyframe_interval
+        self.start_round = history.start_round if history is not None else start_round
+        self.history = history
+        self._last = None  # the board of the last append, to diff the next one against
+
+    @classmethod
+    def from_history(cls, history, names):
+        # every round of a game_history.GameHistory, starting board included
+        return cls(names, history)
+
+    def append(self, map):
+        # record the board after another round: only the cells that changed since the last one are kept
+        game_map = as_map(map)
+        if game_map.names != self.names:
+            raise ValueError("every frame in an archive must use the archive's name table")
+        self.append_grid(game_map.grid)
+
+    def append_grid(self, grid):
+        # append() for a bare id grid over the archive's name table
+        if self.history is None:
+            self.history = GameHistory(grid, self.keyframe_interval, self.start_round)
+        else:
+            last = self._last if self._last is not None else self.history.grid_at(self.history.last_round)
+            flipped = np.flatnonzero(grid != last)
+            owners = np.unique(grid.flat[flipped])
+            # a round hands cells to one winner; anything else is kept as a keyframe
+            winner = int(owners[0]) if len(owners) == 1 else NO_PLAYER
+            self.history.record(NO_PLAYER, NO_PLAYER, winner, flipped, grid, keyframe=len(owners) > 1)
+        self._last = np.array(grid, dtype=np.int16, copy=True)
+
+    def __len__(self):
+        return 0 if self.history is None else self.history.rounds + 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return self.history.grid_at(self.history.start_round + index)
+
+    def frames(self):
+        # every board in order, replayed in one pass (one buffer, updated in place)
+        if self.history is not None:
+            for _, grid in self.history.replay():
+                yield grid
+
+    def nbytes(self):
+        return 0 if self.history is None else self.history.nbytes()
+
+
+def save_archive(archive, path):
+    np.savez_compressed(path, names=np.array(archive.names), **archive.history.to_arrays())
+
+
+def load_archive(path):
+    with np.load(path) as data:
+        return FrameArchive([str(name) for name in data["names"]], GameHistory.from_arrays(data))
+
+
+def frame_runs(archive, dedupe=True):
+    # [(frame index, how many frames it stands for)]; with dedupe a run of rounds where no cell changed
+    # hands is one entry
+    runs = [(0, 1)]
+    for round_number, (_, _, _, flipped) in enumerate(archive.history.events, 1):
+        if dedupe and len(flipped) == 0:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((round_number, 1))
+    return runs
+
+
+def run_frames(archive, runs):
+    # the board each run shows, in order, replayed in one pass
+    shown = {index for index, _ in runs}
+    return (grid for index, (_, grid) in enumerate(archive.history.replay()) if index in shown)
+
+
+def export_tile(scale):
+    # the level-of-detail tile size nearest to a 64px icon scaled by scale
+    return min(LOD_TILE_SIZES, key=lambda tile: abs(tile - ICON_SIZE * scale))
+
+
+def export_atlas(names, scale=1.0):
+    # the shared icon atlas, shrunk once up front (the same box filter the renderers zoom out with) so
+    # downscaled exports never touch full-size frames
+    return np.ascontiguousarray(downsample_atlas(icon_atlas(names), export_tile(scale)))
+
+
+def export(archive, path, fps=10, scale=1.0, dedupe=True):
+    # the format comes from the extension: .gif, .png/.apng (animated PNG) or .mp4.
+    # Frames are composed one at a time straight from the grids; with dedupe a board that didn't
+    # change is composed once and held for longer, so the timing is the same either way.
+    if not len(archive):
+        raise ValueError("the archive has no frames")
+    atlas = export_atlas(archive.names, scale)
+    runs = frame_runs(archive, dedupe)
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".mp4":
+        import cv2
+        height, width = archive.history.keyframes[0].shape
+        size = (width * atlas.shape[2], height * atlas.shape[1])
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+        try:
+            for grid, (_, repeats) in zip(run_frames(archive, runs), runs):
+                frame = np.ascontiguousarray(compose_frame(grid, atlas)[..., ::-1])
+                for _ in range(repeats):
+                    writer.write(frame)
+        finally:
+            writer.release()
+    elif extension == ".gif":
+        # one palette for the whole game, taken from the icons, so frames are composed straight
+        # into palette indices and never quantized one by one
+        from PIL import Image
+        mosaic = Image.fromarray(atlas.reshape(-1, atlas.shape[2], 3)).quantize(256)
+        indexed = np.array(mosaic).reshape(atlas.shape[:3] + (1,))
+        palette = mosaic.getpalette()
+
+        def frames():
+            for grid in run_frames(archive, runs):
+                image = Image.fromarray(compose_frame(grid, indexed)[..., 0])
+                image.putpalette(palette)  # turns the "L" image into a "P" one
+                yield image
+
+        images = frames()
+        next(images).save(path, format="GIF", save_all=True, append_images=images,
+                          duration=[1000 / fps * repeats for _, repeats in runs], loop=0)
+    elif extension in (".png", ".apng"):
+        # Pillow's PNG writer walks append_images twice, so these frames have to be a list
+        from PIL import Image
+        images = [Image.fromarray(compose_frame(grid, atlas)) for grid in run_frames(archive, runs)]
+        images[0].save(path, format="PNG", save_all=True, append_images=images[1:],
+                       duration=[1000 / fps * repeats for _, repeats in runs], loop=0)
+    else:
+        raise ValueError(f"can't export to {extension or path!r}: use .gif, .png, .apng or .mp4")
+    return len(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a frame archive as an animated GIF, APNG or MP4.")
+    parser.add_argument("archive", help="an archive written by main.py --archive (.npz)")
+    parser.add_argument("output", help="where to write the animation (.gif, .png, .apng or .mp4)")
+    parser.add_argument("--fps", type=float, default=10)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="shrink each 64px icon by this factor, e.g. 0.25 (rounded to 64, 32, ..., 1 px)")
+    parser.add_argument("--no-dedupe", action="store_true", help="compose every frame, even unchanged ones")
+    args = parser.parse_args()
+
+    archive = load_archive(args.archive)
+    composed = export(archive, args.output, args.fps, args.scale, not args.no_dedupe)
+    print(f"{len(archive)} frames ({composed} composed) written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
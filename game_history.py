@@ -0,0 +1,87 @@
+#compact game history: the starting grid plus one small event per round, replayed on demand
+
+import numpy as np
+
+# attacker/defender of a round recorded without knowing who fought (e.g. from a board diff)
+NO_PLAYER = -1
+
+
+class GameHistory:
+    def __init__(self, initial_grid, keyframe_interval=50, start_round=0):
+        # a copy of the grid is kept every keyframe_interval rounds so replays stay short.
+        # start_round is the game's round number at initial_grid (a resumed checkpoint's round); the
+        # round numbers taken and returned below count from it, like the app's round counter.
+        self.keyframe_interval = keyframe_interval
+        self.start_round = start_round
+        self.keyframes = {0: np.array(initial_grid, dtype=np.int16, copy=True)}  # keyed by rounds recorded
+        self.events = []
+
+    @property
+    def rounds(self):
+        # how many rounds have been recorded
+        return len(self.events)
+
+    @property
+    def last_round(self):
+        return self.start_round + self.rounds
+
+    def record(self, attacker, defender, winner, flipped, grid=None, keyframe=False):
+        # attacker/defender/winner are player ids, flipped the flat cell indices the winner took.
+        # keyframe=True keeps grid as a keyframe whatever the round, for a change one winner can't describe.
+        self.events.append((int(attacker), int(defender), int(winner), np.asarray(flipped, dtype=np.int32)))
+        if grid is not None and (keyframe or self.keyframe_interval and self.rounds % self.keyframe_interval == 0):
+            self.keyframes[self.rounds] = np.array(grid, dtype=np.int16, copy=True)
+
+    def event(self, round_number):
+        # the event that produced round_number (start_round + 1 onwards)
+        if not self.start_round < round_number <= self.last_round:
+            raise IndexError(f"round {round_number} is outside {self.start_round + 1}..{self.last_round}")
+        return self.events[round_number - self.start_round - 1]
+
+    def grid_at(self, round_number):
+        # the board after round_number, replayed from the nearest earlier keyframe
+        if not self.start_round <= round_number <= self.last_round:
+            raise IndexError(f"round {round_number} is outside {self.start_round}..{self.last_round}")
+        recorded = round_number - self.start_round
+        start = max(r for r in self.keyframes if r <= recorded)
+        grid = self.keyframes[start].copy()
+        for _, _, winner, flipped in self.events[start:recorded]:
+            grid.flat[flipped] = winner
+        return grid
+
+    def replay(self):
+        # (round, grid) for every round from start_round in one pass; the grid is one buffer updated in place
+        grid = self.keyframes[0].copy()
+        yield self.start_round, grid
+        for recorded, (_, _, winner, flipped) in enumerate(self.events, 1):
+            if recorded in self.keyframes:
+                grid[...] = self.keyframes[recorded]
+            else:
+                grid.flat[flipped] = winner
+            yield self.start_round + recorded, grid
+
+    def to_arrays(self):
+        # the history as flat arrays for np.savez; from_arrays reads them back
+        rounds = sorted(self.keyframes)
+        return {
+            "keyframe_interval": np.array(self.keyframe_interval),
+            "start_round": np.array(self.start_round),
+            "keyframe_rounds": np.array(rounds, dtype=np.int32),
+            "keyframes": np.stack([self.keyframes[r] for r in rounds]),
+            "event_players": np.array([event[:3] for event in self.events], dtype=np.int32).reshape(-1, 3),
+            "event_sizes": np.array([len(event[3]) for event in self.events], dtype=np.int32),
+            "event_cells": np.concatenate([event[3] for event in self.events] or [np.empty(0, dtype=np.int32)]),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        start_round = int(arrays["start_round"]) if "start_round" in arrays else 0
+        history = cls(arrays["keyframes"][0], int(arrays["keyframe_interval"]), start_round)
+        history.keyframes = {int(r): grid for r, grid in zip(arrays["keyframe_rounds"], arrays["keyframes"])}
+        cells = np.split(arrays["event_cells"], np.cumsum(arrays["event_sizes"])[:-1]) if len(arrays["event_sizes"]) else []
+        history.events = [(int(a), int(d), int(w), flipped) for (a, d, w), flipped in zip(arrays["event_players"], cells)]
+        return history
+
+    def nbytes(self):
+        events = sum(flipped.nbytes + 3 * 8 for _, _, _, flipped in self.events)
+        return events + sum(grid.nbytes for grid in self.keyframes.values())
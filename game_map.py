@@ -0,0 +1,283 @@
+#the core map type: a compact int16 grid of player ids plus the name table for those ids
+
+import os
+import numpy as np
+from character_roster import roster
+
+BLANK = "blank"
+BLANK_ID = 0
+
+# canonical name table, so every map built from the roster shares the same ids
+ROSTER_NAMES = [BLANK] + [character for row in roster for character in row if character != BLANK]
+
+
+class WeightedSampler:
+    # Fenwick (binary indexed) tree over indices 0..n-1: a weight changes in O(log n), and a draw
+    # proportional to the weights is one O(log n) descent instead of a pass over every item
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.tree = [0] * (self.size + 1)
+        for i, weight in enumerate(weights, start=1):
+            self.tree[i] += int(weight)
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.total = sum(int(weight) for weight in weights)
+        self.top = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def add(self, index, delta):
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, k):
+        # the index whose slice of [0, total) holds k, slices laid out in index order
+        position = 0
+        step = self.top
+        while step:
+            if position + step <= self.size and self.tree[position + step] <= k:
+                position += step
+                k -= self.tree[position]
+            step >>= 1
+        return position
+
+    def sample(self, rng):
+        # rng is a random.Random (or the random module); randrange(total) draws like rng.choice over a
+        # list with one entry per unit of weight would, without building the list
+        return self.find(rng.randrange(self.total))
+
+
+class TerritoryLedger:
+    # live tile count per player id, kept up to date by delta as tiles change hands
+
+    def __init__(self, counts):
+        self.tiles = {player_id: int(n) for player_id, n in enumerate(counts) if player_id != BLANK_ID and n > 0}
+        # weights are tile counts, so sample() picks a player with the odds of picking a random tile
+        self.sampler = WeightedSampler([0 if player_id == BLANK_ID else int(n) for player_id, n in enumerate(counts)])
+
+    def move(self, from_id, to_id, n=1):
+        if n <= 0 or from_id == to_id:
+            return
+        if from_id != BLANK_ID:
+            left = self.tiles[from_id] - n
+            if left > 0:
+                self.tiles[from_id] = left
+            else:
+                del self.tiles[from_id]
+            self.sampler.add(from_id, -n)
+        if to_id != BLANK_ID:
+            self.tiles[to_id] = self.tiles.get(to_id, 0) + n
+            self.sampler.add(to_id, n)
+
+    def sample(self, rng):
+        # a player id drawn in proportion to its tiles, the same odds as rng.choice(Map.tiles())
+        return self.sampler.sample(rng)
+
+    def count(self, player_id):
+        return self.tiles.get(player_id, 0)
+
+    def live(self):
+        return sorted(self.tiles)
+
+    def total(self):
+        return sum(self.tiles.values())
+
+    def winner(self):
+        # the last player standing, or None while more than one is left
+        if len(self.tiles) == 1:
+            return next(iter(self.tiles))
+        return None
+
+    def ranking(self):
+        # (player_id, tiles) from biggest to smallest, ties in id order
+        return sorted(self.tiles.items(), key=lambda item: (-item[1], item[0]))
+
+
+# the 8 surrounding cells, in the same order the old neighbour loops visited them
+NEIGHBOUR_OFFSETS = [(dx, dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1] if (dx, dy) != (0, 0)]
+
+
+class AdjacencyIndex:
+    # for each player, the opponents it borders and how many neighbouring cell pairs
+    # (8-connected) they share. Blank cells never border anyone.
+
+    def __init__(self, grid):
+        self.edges = {}
+        self.apply(grid, np.arange(grid.size), 1)
+
+    def apply(self, grid, flat, sign):
+        # add (sign=1) or remove (sign=-1) every neighbouring pair touching the given cells.
+        # A pair whose cells are both in flat is only counted from its lower index.
+        height, width = grid.shape
+        offsets = np.array(NEIGHBOUR_OFFSETS)
+        rows, cols = np.divmod(flat, width)
+        nr = rows[:, None] + offsets[:, 0]
+        nc = cols[:, None] + offsets[:, 1]
+        inside = (nr >= 0) & (nr < height) & (nc >= 0) & (nc < width)
+        cell = np.broadcast_to(flat[:, None], nr.shape)[inside]
+        other = nr[inside] * width + nc[inside]
+        keep = (other > cell) | ~np.isin(other, flat)
+        a = grid.flat[cell[keep]].astype(np.int64)
+        b = grid.flat[other[keep]].astype(np.int64)
+        keep = (a != b) & (a != BLANK_ID) & (b != BLANK_ID)
+        low, high = np.minimum(a[keep], b[keep]), np.maximum(a[keep], b[keep])
+        pairs, counts = np.unique(low << 16 | high, return_counts=True)
+        for pair, n in zip(pairs.tolist(), counts.tolist()):
+            self._add(pair >> 16, pair & 0xFFFF, sign * n)
+
+    def _add(self, a, b, n):
+        for x, y in ((a, b), (b, a)):
+            row = self.edges.setdefault(x, {})
+            total = row.get(y, 0) + n
+            if total > 0:
+                row[y] = total
+            else:
+                del row[y]
+                if not row:
+                    del self.edges[x]
+
+    def opponents(self, player_id):
+        # ids of everyone bordering player_id, in id order
+        return sorted(self.edges.get(player_id, ()))
+
+    def border(self, a, b):
+        return self.edges.get(a, {}).get(b, 0)
+
+
+class Map:
+    def __init__(self, grid, names=None):
+        self.grid = np.asarray(grid, dtype=np.int16)
+        self.names = list(names) if names is not None else list(ROSTER_NAMES)
+        if self.names[BLANK_ID] != BLANK:
+            raise ValueError(f"id {BLANK_ID} must be '{BLANK}', got '{self.names[BLANK_ID]}'")
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.ledger = TerritoryLedger(self.counts())
+        self.adjacency = AdjacencyIndex(self.grid)
+        # flat indices of the cells changed by the most recent assign()
+        self.last_flipped = np.empty(0, dtype=np.intp)
+
+    @classmethod
+    def from_roster(cls, players, names=None):
+        # accepts the list-of-lists roster format, appending any unknown names to the table
+        names = list(names) if names is not None else list(ROSTER_NAMES)
+        ids = {name: i for i, name in enumerate(names)}
+        for row in players:
+            for character in row:
+                if character not in ids:
+                    ids[character] = len(names)
+                    names.append(character)
+        grid = [[ids[character] for character in row] for row in players]
+        return cls(grid, names)
+
+    def to_roster(self):
+        names = np.array(self.names, dtype=object)
+        return names[self.grid].tolist()
+
+    def copy(self):
+        return Map(self.grid.copy(), self.names)
+
+    # ---- name <-> id ----
+
+    def id_of(self, name):
+        return self.ids[name]
+
+    def name_of(self, player_id):
+        return self.names[player_id]
+
+    # ---- shape / legacy access ----
+
+    @property
+    def shape(self):
+        return self.grid.shape
+
+    @property
+    def height(self):
+        return self.grid.shape[0]
+
+    @property
+    def width(self):
+        return self.grid.shape[1]
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, row):
+        # map[i][j] returns the name, like the old list-of-lists. Rows are read-only tuples, so old code
+        # that writes map[i][j] = name fails loudly; cells change through assign()
+        return tuple(self.names[player_id] for player_id in self.grid[row])
+
+    def __iter__(self):
+        return (tuple(row) for row in self.to_roster())
+
+    # ---- queries ----
+
+    def counts(self):
+        # tile count per id, indexed like self.names (a full recount; prefer self.ledger)
+        return np.bincount(self.grid.ravel(), minlength=len(self.names))
+
+    def count(self, name):
+        return self.ledger.count(self.ids[name])
+
+    def players(self):
+        # ids of every player still holding a tile, in id order
+        return self.ledger.live()
+
+    def tiles(self):
+        # every non-blank tile's owner id, one entry per tile
+        flat = self.grid.ravel()
+        return flat[flat != BLANK_ID]
+
+    # ---- updates ----
+
+    def assign(self, rows, cols, player_id):
+        # hand the given cells to player_id; every change to the grid should go through here
+        # so the ledger and adjacency index stay in step with it
+        flat = np.ravel_multi_index((rows, cols), self.shape)
+        previous = self.grid.flat[flat]
+        flat = flat[previous != player_id]
+        previous = previous[previous != player_id]
+
+        self.adjacency.apply(self.grid, flat, -1)
+        self.grid.flat[flat] = player_id
+        self.adjacency.apply(self.grid, flat, 1)
+        self.last_flipped = flat
+
+        owners, changed = np.unique(previous, return_counts=True)
+        for owner, n in zip(owners.tolist(), changed.tolist()):
+            self.ledger.move(owner, player_id, n)
+
+
+def dilate(mask):
+    # grow a boolean mask by one cell in all 8 directions (works on (..., H, W) stacks too)
+    height, width = mask.shape[-2:]
+    pad = [(0, 0)] * (mask.ndim - 2) + [(1, 1), (1, 1)]
+    padded = np.pad(mask, pad)
+    out = np.zeros_like(mask)
+    for dx in [-1, 0, 1]:
+        for dy in [-1, 0, 1]:
+            out |= padded[..., 1 + dx:1 + dx + height, 1 + dy:1 + dy + width]
+    return out
+
+
+def save_map(game_map, path):
+    # map file format: a .npz holding the int16 id grid and the name table it indexes
+    np.savez_compressed(path, grid=game_map.grid, names=np.array(game_map.names))
+
+
+def load_map(path):
+    # path can be a file name or an open binary file
+    with np.load(path, allow_pickle=False) as data:
+        return Map(data["grid"], data["names"].tolist())
+
+
+def as_map(players):
+    # conversion layer: lets the old list-of-lists rosters, or a map file path,
+    # be passed anywhere a Map is expected
+    if isinstance(players, Map):
+        return players
+    if isinstance(players, (str, os.PathLike)):
+        return load_map(players)
+    return Map.from_roster(players)
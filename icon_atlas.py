@@ -0,0 +1,103 @@
+#preprocessed character icons: one (n_characters, 64, 64, 3) RGB uint8 array per name table, kept in the
+#process-wide render cache. Every renderer backend draws from it, so they all produce the same pixels.
+
+import hashlib
+import os
+import numpy as np
+
+from shared_resources import render_cache
+
+ICON_SIZE = 64
+# tile sizes a board can be drawn at, from full icons down to one averaged pixel per cell
+LOD_TILE_SIZES = (64, 32, 16, 8, 4, 2, 1)
+ICON_FOLDER = "Stock Icons"
+BLANK_COLOR = (255, 255, 255)
+
+# set ICON_ATLAS_DIR to keep built atlases as .npy files that are memory-mapped on the next start
+ATLAS_DIR = os.environ.get("ICON_ATLAS_DIR")
+
+
+def decode_icon(name, folder=ICON_FOLDER):
+    # one character's icon over the complement of its average visible colour; white if it's blank or missing
+    from PIL import Image
+
+    if name == "blank":
+        return np.full((ICON_SIZE, ICON_SIZE, 3), BLANK_COLOR, dtype=np.uint8)
+    try:
+        img = Image.open(os.path.join(folder, f"{name}.png")).convert("RGBA").resize((ICON_SIZE, ICON_SIZE))
+    except Exception:
+        return np.full((ICON_SIZE, ICON_SIZE, 3), BLANK_COLOR, dtype=np.uint8)
+
+    rgb = np.array(img.convert("RGB")).astype(np.float32) / 255
+    alpha = np.array(img.getchannel("A")).astype(np.float32) / 255
+    mean_rgb = np.sum(rgb * alpha[..., None], axis=(0, 1)) / (np.sum(alpha) + 1e-5)
+    background = Image.new("RGB", img.size, color=tuple(((1.0 - mean_rgb) * 255).astype(np.uint8)))
+    return np.array(Image.alpha_composite(background.convert("RGBA"), img).convert("RGB"))
+
+
+def icon_atlas(names):
+    return get_icon_atlas("icons", names, decode_icon)
+
+
+def atlas_path(backend, names, folder):
+    # the name table is part of the file name, so a different roster never reuses a stale atlas
+    digest = hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(folder, f"icon_atlas_{backend}_{digest}.npy")
+
+
+def build_icon_atlas(names, load_icon):
+    atlas = np.empty((len(names), ICON_SIZE, ICON_SIZE, 3), dtype=np.uint8)
+    for i, name in enumerate(names):
+        atlas[i] = load_icon(name)
+    return atlas
+
+
+def get_icon_atlas(backend, names, load_icon, folder=None):
+    # cached per (backend, name table) in the render cache, read-only; load_icon(name) decodes a single
+    # icon for that backend
+    folder = folder if folder is not None else ATLAS_DIR
+
+    def build():
+        atlas = None
+        path = atlas_path(backend, names, folder) if folder else None
+        if path and os.path.exists(path):
+            atlas = np.load(path, mmap_mode="r")
+            if atlas.shape != (len(names), ICON_SIZE, ICON_SIZE, 3) or atlas.dtype != np.uint8:
+                atlas = None  # wrong shape, rebuild it
+        if atlas is None:
+            atlas = build_icon_atlas(names, load_icon)
+            if path:
+                save_icon_atlas(atlas, path)
+        return atlas
+
+    return render_cache().get(("icons", backend, tuple(names)), build)
+
+
+def save_icon_atlas(atlas, path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    np.save(path, np.ascontiguousarray(atlas))
+
+
+def downsample_atlas(atlas, tile):
+    # every icon box-averaged down to tile x tile (a divisor of the icon size); at 1 it's the icon's mean colour
+    n, size, _, channels = atlas.shape
+    if tile == size:
+        return atlas
+    factor = size // tile
+    blocks = atlas.reshape(n, tile, factor, tile, factor, channels).mean(axis=(2, 4))
+    return blocks.round().astype(np.uint8)
+
+
+def tile_view(frame, height, width):
+    # (H*t, W*t, 3) frame seen as (H, t, W, t, 3), so frame_tiles[r, :, c] is one cell; t is the tile size
+    return frame.reshape(height, frame.shape[0] // height, width, frame.shape[1] // width, 3)
+
+
+def compose_frame(grid, atlas):
+    # a whole board is just the atlas indexed by the id grid (tiles are usually 64x64, smaller when scaled)
+    height, width = grid.shape
+    _, tile_h, tile_w, channels = atlas.shape
+    tiles = atlas[grid]  # (H, W, tile_h, tile_w, channels)
+    return np.ascontiguousarray(tiles.transpose(0, 2, 1, 3, 4)).reshape(height * tile_h, width * tile_w, channels)
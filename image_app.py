@@ -1,24 +1,53 @@
 import streamlit as st
-from PIL import Image
 from io import BytesIO
-from collections import Counter
 from streamlit_image_coordinates import streamlit_image_coordinates
 import random
+import pandas as pd
 
 from character_roster import roster as starting_roster
-from streamlit_visualisations import plot_map
+from streamlit_visualisations import encoded_board_frame
 from utils import (
     calculate_advantage,
+    matchup_matrix,
     update_map,
 )
+from game_map import Map, as_map
+from checkpoint import load_checkpoint, save_checkpoint
+from game_history import GameHistory
+from solver import solve
+from icon_atlas import ICON_SIZE, LOD_TILE_SIZES
+from rendering import fit_tile, visible_cells
+from shared_resources import ENCODED_MAX_BYTES, ResourceCache, render_cache
+import profiling
+
+# boards that don't fit in this many pixels with full icons get zoom and scroll controls
+MAX_VIEW_WIDTH = 1280
+MAX_VIEW_HEIGHT = 960
+
+# exact odds are offered once this few players are left, and each attempt explores at most this many
+# boards for at most this long; odds are shown as ranges while no more than this much is left undecided
+EXACT_ODDS_MAX_PLAYERS = 4
+EXACT_ODDS_MAX_STATES = 10000
+EXACT_ODDS_SECONDS = 3
+EXACT_ODDS_TOLERANCE = 0.5
 
 # ---------------- Initialization ---------------- #
 
-def initialize_game():
-    st.session_state.map = [row.copy() for row in starting_roster]
-    st.session_state.round = 0
+def initialize_game(starting_map=None, starting_round=0):
+    # starting_map is a Map loaded from a map file or a checkpoint saved after starting_round rounds;
+    # restarts reuse the last ones loaded
+    if starting_map is not None:
+        st.session_state.starting_map = starting_map
+        st.session_state.starting_round = starting_round
+    starting_map = st.session_state.get("starting_map")
+    st.session_state.map = starting_map.copy() if starting_map is not None else Map.from_roster(starting_roster)
+    st.session_state.round = st.session_state.get("starting_round", 0)
     st.session_state.game_over = False
-    st.session_state.images = [plot_map(st.session_state.map, return_image=True)]
+    for key in ("zoom", "view_top", "view_left", "exact_odds", "history_round"):
+        st.session_state.pop(key, None)
+    # no frames are kept per session: the board is drawn from the shared cache, and past rounds
+    # are rebuilt from the event log when viewed
+    st.session_state.history = GameHistory(st.session_state.map.grid, start_round=st.session_state.round)
 
     st.session_state.last_attacker = None
     st.session_state.last_defender = None
@@ -29,29 +58,57 @@ def initialize_game():
     st.session_state.pending_attacker = None
     st.session_state.pending_defender = None
     st.session_state.pending_advantage = None
-    st.session_state.random_character_pool = [
-        p for row in st.session_state.map for p in row if p != "blank"]
+    game_map = st.session_state.map
+    st.session_state.random_character_pool = [game_map.name_of(p) for p in game_map.tiles()]
 
 
 # ---------------- Utility ---------------- #
 
+def shared_resources():
+    # one cache per server process, shared by every session: the renderers' own, which also holds the atlases
+    return render_cache()
+
+@st.cache_resource
+def encoded_frames():
+    # PNG bytes of frames already shown, so a rerun that changes nothing on the board skips the renderer
+    return ResourceCache(ENCODED_MAX_BYTES)
+
+def current_view():
+    # (tile, viewport) the map is drawn at: pixels per cell, and the (top, left, rows, cols) part of the
+    # board on screen. Large boards start zoomed out to fit; see render_view_controls.
+    rows, cols = st.session_state.map.shape
+    tile = max(st.session_state.get("zoom", 0), fit_tile(rows, cols, MAX_VIEW_WIDTH, MAX_VIEW_HEIGHT))
+    view_rows, view_cols = visible_cells(rows, cols, tile, MAX_VIEW_WIDTH, MAX_VIEW_HEIGHT)
+    top = min(st.session_state.get("view_top", 0), rows - view_rows)
+    left = min(st.session_state.get("view_left", 0), cols - view_cols)
+    return tile, (top, left, view_rows, view_cols)
+
+def render_map(attacker=None, defender=None):
+    # sessions showing the same board, view and highlight share one encoded frame
+    tile, viewport = current_view()
+    return encoded_board_frame(st.session_state.map, attacker, defender, cache=shared_resources(),
+                               encoded=encoded_frames(), tile=tile, viewport=viewport)
+
+def current_frame():
+    return render_map(st.session_state.pending_attacker, st.session_state.pending_defender)
+
 def check_winner(current_map):
-    flattened = [p for row in current_map for p in row if p != "blank"]
-    remaining = Counter(flattened)
-    if len(remaining) == 1:
-        return True, list(remaining.keys())[0]
+    current_map = as_map(current_map)
+    winner = current_map.ledger.winner()
+    if winner is not None:
+        return True, current_map.name_of(winner)
     return False, None
 
 def get_player_scores():
-    flat_map = [p for row in st.session_state.map for p in row if p != "blank"]
-    return Counter(flat_map)
+    # (player, tiles) from the territory ledger, biggest first
+    game_map = st.session_state.map
+    return [(game_map.name_of(p), count) for p, count in game_map.ledger.ranking()]
 
 def render_scoreboard():
-    scores = get_player_scores()
-    if not scores:
+    sorted_scores = get_player_scores()
+    if not sorted_scores:
         return
 
-    sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
     leader = sorted_scores[0][0]
 
     with st.container():
@@ -63,7 +120,9 @@ def render_scoreboard():
             )
 
 
-def convert_click_to_cell(click, img, grid_rows, grid_cols):
+def convert_click_to_cell(click, img, grid_rows, grid_cols, origin=(0, 0)):
+    # grid_rows x grid_cols are the cells in the image and origin the board cell at its top left,
+    # so this holds at any zoom and scroll position
     if not click:
         return None, None
     img_width, img_height = img.size
@@ -71,35 +130,30 @@ def convert_click_to_cell(click, img, grid_rows, grid_cols):
     cell_height = img_height / grid_rows
     col = int(click["x"] // cell_width)
     row = int(click["y"] // cell_height)
-    return row, col
+    return origin[0] + row, origin[1] + col
 
 
 # ---------------- Game Flow ---------------- #
 
-def handle_map_click(click):
+def handle_map_click(click, image):
     if st.session_state.get("skip_next_click"):
         st.session_state.skip_next_click = False
         return
 
     map = st.session_state.map
-    grid_rows = len(map)
-    grid_cols = len(map[0])
-    image = st.session_state.images[-1]
-
-    row, col = convert_click_to_cell(click, image, grid_rows, grid_cols)
+    grid_rows, grid_cols = map.shape
+    _, (top, left, view_rows, view_cols) = current_view()
+    row, col = convert_click_to_cell(click, image, view_rows, view_cols, origin=(top, left))
 
     if row is not None and 0 <= row < grid_rows and 0 <= col < grid_cols:
-        clicked_cell = map[row][col]
+        clicked_cell = map.name_of(map.grid[row, col])
 
         if clicked_cell == "blank":
             return
 
         if st.session_state.pending_attacker is None:
-            # 🔥 Highlight attacker and defender on map
+            # 🔥 the attacker is highlighted on the rerun
             st.session_state.pending_attacker = clicked_cell
-            attacker = st.session_state.pending_attacker
-            highlighted_img = plot_map(map, return_image=True, attacker=attacker)
-            st.session_state.images[-1] = highlighted_img
             st.rerun()
 
         elif st.session_state.pending_defender is None and clicked_cell != st.session_state.pending_attacker:
@@ -108,14 +162,10 @@ def handle_map_click(click):
             attacker = st.session_state.pending_attacker
             defender = st.session_state.pending_defender
 
-            attacker_count = sum(r.count(attacker) for r in map)
-            defender_count = sum(r.count(defender) for r in map)
+            attacker_count = map.count(attacker)
+            defender_count = map.count(defender)
             st.session_state.pending_advantage = calculate_advantage(attacker_count, defender_count)
 
-            # 🔥 Highlight attacker and defender on map
-            highlighted_img = plot_map(map, return_image=True, attacker=attacker, defender=defender)
-            st.session_state.images[-1] = highlighted_img
-
             st.session_state.phase = "resolution"
             st.rerun()
 
@@ -126,14 +176,16 @@ def resolve_round(victor_choice):
     defender = st.session_state.pending_defender
     advantage = st.session_state.pending_advantage
 
-    attacker_count = sum(row.count(attacker) for row in map)
-    defender_count = sum(row.count(defender) for row in map)
+    attacker_count = map.count(attacker)
+    defender_count = map.count(defender)
 
     winner = attacker if victor_choice == "A" else defender
     loser = defender if victor_choice == "A" else attacker
     losing_count = defender_count if victor_choice == "A" else attacker_count
 
-    updated_map = update_map(map, winner, loser, losing_count)
+    profiling.start_round()
+    with profiling.timer("resolve.update_map"):
+        updated_map = update_map(map, winner, loser, losing_count)
     character_pool = st.session_state.random_character_pool
     try:
         character_pool.remove(winner)
@@ -150,9 +202,14 @@ def resolve_round(victor_choice):
     st.session_state.last_advantage = advantage
     st.session_state.last_victor = winner
 
-    st.session_state.images.append(plot_map(updated_map, return_image=True))
+    with profiling.timer("resolve.history"):
+        st.session_state.history.record(
+            updated_map.id_of(attacker), updated_map.id_of(defender), updated_map.id_of(winner),
+            updated_map.last_flipped, updated_map.grid)
 
-    over, winning_player = check_winner(updated_map)
+    with profiling.timer("resolve.check_winner"):
+        over, winning_player = check_winner(updated_map)
+    st.session_state.last_profile = dict(profiling.current().last_round)
     if over:
         st.session_state.game_over = True
         st.success(f"Game over! {winning_player} controls the entire map.")
@@ -166,11 +223,29 @@ def resolve_round(victor_choice):
 
 # ---------------- UI Rendering ---------------- #
 
+def render_view_controls():
+    rows, cols = st.session_state.map.shape
+    fit = fit_tile(rows, cols, MAX_VIEW_WIDTH, MAX_VIEW_HEIGHT)
+    if fit == ICON_SIZE:
+        return  # the whole board fits with full icons
+    with st.expander("View", expanded=True):
+        zooms = [tile for tile in reversed(LOD_TILE_SIZES) if tile >= fit]
+        if st.session_state.get("zoom") not in zooms:
+            st.session_state.zoom = fit
+        tile = st.select_slider("Zoom (pixels per cell)", zooms, key="zoom")
+        view_rows, view_cols = visible_cells(rows, cols, tile, MAX_VIEW_WIDTH, MAX_VIEW_HEIGHT)
+        for key, label, hidden in (("view_top", "Top row", rows - view_rows), ("view_left", "Left column", cols - view_cols)):
+            if hidden > 0:
+                st.session_state[key] = min(st.session_state.get(key, 0), hidden)
+                st.slider(label, 0, hidden, key=key)
+        st.caption(f"Showing {view_rows}x{view_cols} of {rows}x{cols} cells")
+
+
 def render_map_and_click_handler():
-    image = st.session_state.images[-1]
+    image = current_frame()
     st.write("### Click a unit to select Attacker and Defender")
     click = streamlit_image_coordinates(image, key=f"map_click_{st.session_state.round}")
-    handle_map_click(click)
+    handle_map_click(click, image)
 
 
 def render_last_round_summary():
@@ -185,6 +260,68 @@ def render_last_round_summary():
         st.write(f"🏆 Winner: **{st.session_state.last_victor}**")
 
 
+def render_matchup_matrix():
+    with st.expander("Matchup handicaps"):
+        names, matrix = matchup_matrix(st.session_state.map)
+        st.caption("Advantage (%) of the row player attacking the column player at the current tile counts.")
+        st.dataframe(pd.DataFrame(matrix, index=names, columns=names))
+
+
+def render_exact_odds():
+    with st.expander("Exact odds"):
+        st.caption("Each player's chance of winning from here if every battle is a coin flip, solved over "
+                   "the likeliest boards the game can reach. Only practical once a few players are left.")
+        game_map = st.session_state.map
+        live = len(game_map.players())
+        computed = st.session_state.get("exact_odds")
+        if computed and computed[0] != st.session_state.round:
+            computed = None
+        unsolvable = live > EXACT_ODDS_MAX_PLAYERS or (computed is not None and isinstance(computed[1], str))
+        if st.button("Compute exact odds", disabled=unsolvable or live < 2):
+            try:
+                result = solve(game_map, max_states=EXACT_ODDS_MAX_STATES, max_seconds=EXACT_ODDS_SECONDS,
+                               tolerance=EXACT_ODDS_TOLERANCE)
+            except ValueError as e:
+                result = str(e)
+            st.session_state.exact_odds = computed = (st.session_state.round, result)
+        if live > EXACT_ODDS_MAX_PLAYERS:
+            st.caption(f"Available once {EXACT_ODDS_MAX_PLAYERS} or fewer players are left ({live} now).")
+        if not computed:
+            return
+        result = computed[1]
+        if isinstance(result, str):
+            st.warning(result)
+            return
+        undecided = result["unresolved"] if result["unresolved"] >= 0.0005 else 0.0  # below what 0.1% shows
+        for player, p in sorted(result["win_probability"].items(), key=lambda item: -item[1]):
+            st.write(f"- **{player}**: {p:.1%}" + (f" to {p + undecided:.1%}" if undecided > 0 else ""))
+        if undecided > 0:
+            st.caption(f"{undecided:.1%} of outcomes were still undecided after {result['states']:,} boards, "
+                       "so each chance is a range.")
+        st.write(f"Expected rounds left: **{'at least ' if undecided > 0 else ''}{result['expected_rounds']:.1f}** "
+                 f"({result['states']:,} boards)")
+
+
+def render_history_viewer():
+    history = st.session_state.history
+    if history.rounds == 0:
+        return
+    with st.expander("Game history"):
+        round_number = st.slider("View round", history.start_round, history.last_round, history.last_round,
+                                 key="history_round")
+        game_map = st.session_state.map
+        past_map = Map(history.grid_at(round_number), game_map.names)
+        if round_number > history.start_round:
+            attacker, defender, winner, flipped = history.event(round_number)
+            st.write(
+                f"Round {round_number}: **{game_map.name_of(attacker)}** attacked **{game_map.name_of(defender)}**, "
+                f"**{game_map.name_of(winner)}** took {len(flipped)} tile{'s' if len(flipped) != 1 else ''}"
+            )
+        st.image(encoded_board_frame(past_map, cache=shared_resources(), encoded=encoded_frames(),
+                                     tile=fit_tile(*past_map.shape, MAX_VIEW_WIDTH, MAX_VIEW_HEIGHT)).data)
+        st.caption(f"History size: {history.nbytes():,} bytes")
+
+
 def render_game_phase():
     if st.session_state.phase == "preparation":
         if st.session_state.pending_attacker and not st.session_state.pending_defender:
@@ -222,22 +359,65 @@ def render_game_phase():
             st.rerun()
 
 def randomize_attacker():
+    # "pool": uniformly from random_character_pool, which loses each round's fighters;
+    # "territory": in proportion to the tiles each player holds now, like the simulator
+    if st.session_state.get("random_attacker_mode", "pool") == "territory":
+        game_map = st.session_state.map
+        st.session_state.pending_attacker = game_map.name_of(game_map.ledger.sample(random))
+        return
     character_pool = st.session_state.random_character_pool
     if len(character_pool) == 0:
         st.write("All characters have been selected.")
         return
     character = random.choice(character_pool)
     st.session_state.pending_attacker = character
-    map = st.session_state.map
-    highlighted_img = plot_map(map, return_image=True, attacker=character)
-    st.session_state.images[-1] = highlighted_img
 
 def render_restart_button():
     if st.button("Restart Game"):
         initialize_game()
         st.rerun()
 
+def render_debug_panel():
+    with st.sidebar.expander("Debug"):
+        profiling.enable(st.checkbox("Time each phase", value=profiling.is_enabled(), key="profiling_enabled"))
+        last_profile = st.session_state.get("last_profile")
+        if not last_profile:
+            st.caption("Resolve a round with timing on to see its breakdown.")
+            return
+        st.write("Last round:")
+        for phase, seconds in sorted(last_profile.items(), key=lambda item: -item[1]):
+            st.write(f"- {phase}: {seconds * 1000:.2f} ms")
+
+def render_shared_cache_panel():
+    with st.sidebar.expander("Shared render cache"):
+        for label, cache in (("Frames and atlases", shared_resources()), ("Encoded PNGs", encoded_frames())):
+            stats = cache.stats()
+            st.write(f"**{label}**: {stats['entries']} entries, "
+                     f"{stats['bytes'] / 2**20:.1f} of {stats['max_bytes'] / 2**20:.0f} MB")
+            st.write(f"Hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses, "
+                     f"{stats['evictions']} evicted)")
+        if st.button("Clear shared cache"):
+            shared_resources().clear()
+            encoded_frames().clear()
+
+def render_map_loader():
+    # a checkpoint from main.py --checkpoint (or the button below) carries on from its round
+    uploaded = st.sidebar.file_uploader("Load a map file or checkpoint (.npz)", type="npz")
+    if uploaded is not None and st.session_state.get("loaded_map_id") != uploaded.file_id:
+        st.session_state.loaded_map_id = uploaded.file_id
+        game_map, round_number, _ = load_checkpoint(uploaded)
+        initialize_game(game_map, round_number)
+        st.rerun()
+
+def render_checkpoint_download():
+    buffer = BytesIO()
+    save_checkpoint(buffer, st.session_state.map, st.session_state.round)
+    st.sidebar.download_button("Save checkpoint", buffer.getvalue(),
+                               file_name=f"checkpoint_round{st.session_state.round:04}.npz")
+
 def render_random_attacker_button():
+    st.radio("Random attacker from", ["pool", "territory"], key="random_attacker_mode", horizontal=True,
+             format_func={"pool": "the character pool", "territory": "territory (weighted by tiles)"}.get)
     if st.button("Random Attacker"):
         randomize_attacker()
         st.rerun()
@@ -254,10 +434,21 @@ def clear_selection():
 
 def main():
     st.set_page_config(page_title="Battle Map Simulator", layout="wide")
+    # each session switches its own timers and sees only its own rounds; the histograms are shared
+    if "profiler" not in st.session_state:
+        st.session_state.profiler = profiling.Recorder()
+    with profiling.recording(st.session_state.profiler):
+        render_page()
 
+def render_page():
     if "map" not in st.session_state:
         initialize_game()
 
+    render_map_loader()
+    render_checkpoint_download()
+    render_debug_panel()
+    render_shared_cache_panel()
+
     st.title("Battle Map Simulator")
     st.write(f"### Round {st.session_state.round}")
 
@@ -265,8 +456,12 @@ def main():
     col1, col2 = st.columns([3, 1], gap="large")
 
     with col1:
+        render_view_controls()
         render_map_and_click_handler()
         render_last_round_summary()
+        render_history_viewer()
+        render_matchup_matrix()
+        render_exact_odds()
 
         if not st.session_state.game_over:
             render_game_phase()
@@ -0,0 +1,176 @@
+#lockstep batch engine: K independent games held as one (K, H, W) id array and advanced a round at a time
+#together. Attacker draws, neighbour masks, coin flips and conquests are whole-array operations, so the
+#Python cost per round doesn't grow with K. The rules are main.step's and utils.update_map's; each game
+#draws from its own numpy generator seeded with its seed, so its result doesn't depend on the rest of the
+#batch (it is not the same random stream as simulation.play_game, only the same distribution).
+
+import numpy as np
+
+from character_roster import roster as starting_roster
+from game_map import BLANK_ID, as_map, dilate
+from utils import DISTANCE_CHUNK_CELLS, vertical_distance
+
+# uniforms each game draws at a time (three per round), so its generator is called once per this many rounds
+DRAW_BLOCK = 64
+
+
+def lose_counts(losing_player_count):
+    # utils.players_to_lose_for over an array
+    counts = np.asarray(losing_player_count)
+    return np.where(counts < 16, counts, np.where(counts < 32, counts // 2, counts // 4))
+
+
+def squared_distance_batch(masks, games, rows, cols):
+    # utils.squared_distance_to for a (K, H, W) stack: exact squared Euclidean distance from each
+    # (game, row, col) to the nearest True cell of masks[game]. Only the columns that contain a True cell
+    # are kept, every game's side by side, for one vertical pass; each query then takes a min over its
+    # own game's columns, padded to the batch's largest count by repeating one (which doesn't change a min).
+    # Queries in a game with an empty mask get a value larger than any real distance.
+    n_games, height, width = masks.shape
+    has_source = masks.any(axis=1)
+    source_flat = np.flatnonzero(has_source)  # game * width + column, grouped by game
+    per_game = has_source.sum(axis=1)
+    distances = np.full(len(rows), (height + width) ** 2, dtype=np.int64)
+    if not len(source_flat):
+        return distances
+    vertical = vertical_distance(masks.transpose(1, 0, 2).reshape(height, -1)[:, source_flat])
+    first = np.cumsum(per_game) - per_game
+    slots = np.arange(per_game.max())
+    sources = np.where(slots < per_game[:, None], first[:, None] + slots, first[:, None])  # into source_flat
+    source_cols = source_flat[np.minimum(sources, len(source_flat) - 1)] % width
+
+    found = per_game[games] > 0
+    games, rows, cols, at = games[found], rows[found], cols[found], np.flatnonzero(found)
+    chunk = max(1, DISTANCE_CHUNK_CELLS // sources.shape[1])
+    for start in range(0, len(rows), chunk):
+        g = games[start:start + chunk]
+        vertical_sq = vertical[rows[start:start + chunk, None], sources[g]] ** 2
+        horizontal_sq = (cols[start:start + chunk, None] - source_cols[g]) ** 2
+        distances[at[start:start + chunk]] = (vertical_sq + horizontal_sq).min(axis=1)
+    return distances
+
+
+def neighbour_presence(grids, players, n_players):
+    # (K, n_players) bool: which players own a cell touching (8 ways) the territory of players[k] in game k
+    mask = grids == players[:, None, None]
+    ring = dilate(mask) & ~mask
+    presence = np.zeros((len(grids), n_players), dtype=bool)
+    games, rows, cols = np.nonzero(ring)
+    presence[games, grids[games, rows, cols]] = True
+    presence[:, BLANK_ID] = False
+    return presence
+
+
+def pick(weights, u):
+    # index drawn in proportion to each row of weights, using one uniform per row; also returns the
+    # uniform rescaled within the chosen interval, which is again uniform and independent of the choice
+    cumulative = weights.cumsum(axis=1)
+    target = u * cumulative[:, -1]
+    chosen = (cumulative > target[:, None]).argmax(axis=1)
+    rows = np.arange(len(weights))
+    low = cumulative[rows, chosen] - weights[rows, chosen]
+    return chosen, (target - low) / weights[rows, chosen]
+
+
+def conquer(grids, winners, losers, n_lose):
+    # update_map for a stack: each loser gives up its n_lose cells nearest the winner's territory,
+    # ties broken row-major. grids is updated in place. Distances are only taken for the losers' cells.
+    n_games, height, width = grids.shape
+    games, rows, cols = np.nonzero(grids == losers[:, None, None])
+    distances = squared_distance_batch(grids == winners[:, None, None], games, rows, cols)
+    keys = distances * (height * width) + rows * width + cols
+
+    # each game's keys in a row of their own, padded with keys that come last, so one partition finds
+    # every game's n_lose-th smallest
+    per_game = np.bincount(games, minlength=n_games)
+    slots = np.arange(len(games)) - (np.cumsum(per_game) - per_game)[games]
+    padded = np.full((n_games, per_game.max()), np.iinfo(np.int64).max)
+    padded[games, slots] = keys
+    threshold = np.partition(padded, np.unique(n_lose - 1), axis=1)[np.arange(n_games), n_lose - 1]
+    flipped = keys <= threshold[games]
+    grids[games[flipped], rows[flipped], cols[flipped]] = winners[games[flipped]]
+
+
+def play_games(seeds, players=None, max_rounds=None):
+    # one result per seed, in the same format as simulation.play_game. players can be a roster list,
+    # a Map or a map file path. A game where nobody left can reach an opponent ends with no winner
+    # (main.step would have no defender to pick; attackers without neighbours are skipped the same way).
+    start = as_map(players if players is not None else starting_roster)
+    seeds = list(seeds)
+    n_games, n_players = len(seeds), len(start.names)
+    grids = np.repeat(start.grid[None], n_games, axis=0)
+    counts = np.repeat(np.bincount(start.grid.ravel(), minlength=n_players)[None], n_games, axis=0).astype(np.int64)
+    counts[:, BLANK_ID] = 0
+    isolated = np.zeros((n_games, n_players), dtype=bool)  # permanent: blanks never change hands
+    generators = [np.random.default_rng(seed) for seed in seeds]
+    draws = np.empty((n_games, DRAW_BLOCK, 3))
+    eliminated = [[] for _ in seeds]
+    played_to = np.zeros(n_games, dtype=np.int64)
+    rounds = 0
+    active = (counts > 0).sum(axis=1) > 1
+
+    while active.any() and (max_rounds is None or rounds < max_rounds):
+        games = np.flatnonzero(active)
+        if rounds % DRAW_BLOCK == 0:
+            for game in games:
+                draws[game] = generators[game].random((DRAW_BLOCK, 3))
+        u = draws[games, rounds % DRAW_BLOCK]
+
+        # attackers by tile count; one that turns out to have no neighbours is marked isolated and
+        # redrawn from the rest with the rescaled uniform
+        attackers = np.zeros(len(games), dtype=np.int64)
+        presence = np.zeros((len(games), n_players), dtype=bool)
+        u_attack = u[:, 0].copy()
+        pending = np.arange(len(games))
+        while len(pending):
+            weights = counts[games[pending]] * ~isolated[games[pending]]
+            stuck = weights.sum(axis=1) == 0
+            active[games[pending[stuck]]] = False
+            pending, weights = pending[~stuck], weights[~stuck]
+            if not len(pending):
+                break
+            chosen, u_attack[pending] = pick(weights, u_attack[pending])
+            found = neighbour_presence(grids[games[pending]], chosen, n_players)
+            has = found.any(axis=1)
+            isolated[games[pending[~has]], chosen[~has]] = True
+            attackers[pending[has]] = chosen[has]
+            presence[pending[has]] = found[has]
+            pending = pending[~has]
+
+        playing = active[games]
+        games, attackers, presence, u = games[playing], attackers[playing], presence[playing], u[playing]
+        if not len(games):
+            break
+
+        # defender uniformly among the attacker's neighbours, then a coin flip
+        k = (u[:, 1] * presence.sum(axis=1)).astype(np.int64)
+        defenders = (presence.cumsum(axis=1) > k[:, None]).argmax(axis=1)
+        attacker_wins = u[:, 2] < 0.5
+        winners = np.where(attacker_wins, attackers, defenders)
+        losers = np.where(attacker_wins, defenders, attackers)
+
+        n_lose = lose_counts(counts[games, losers])
+        board = grids[games]
+        conquer(board, winners, losers, n_lose)
+        grids[games] = board
+        counts[games, winners] += n_lose
+        counts[games, losers] -= n_lose
+
+        knocked_out = counts[games, losers] == 0
+        for game, loser in zip(games[knocked_out].tolist(), losers[knocked_out].tolist()):
+            eliminated[game].append(start.name_of(loser))
+        rounds += 1
+        finished = games[(counts[games] > 0).sum(axis=1) == 1]
+        active[finished] = False
+        played_to[games] = rounds
+
+    results = []
+    for game, seed in enumerate(seeds):
+        alive = np.flatnonzero(counts[game])
+        results.append({
+            "seed": seed,
+            "winner": start.name_of(int(alive[0])) if len(alive) == 1 else None,
+            "rounds": int(played_to[game]),
+            "eliminated": eliminated[game],
+        })
+    return results
@@ -1,37 +1,27 @@
-import numpy as np
+import argparse
 import random
-from visualisations import plot_map, plot_map_animation, plot_map_animation_to_mp4
 from character_roster import roster as starting_roster
 from utils import calculate_advantage, update_map
+from game_map import Map, as_map
+from frame_archive import FrameArchive, save_archive
+from checkpoint import load_checkpoint, save_checkpoint
+from icon_atlas import LOD_TILE_SIZES
+from rendering import fit_tile
+import profiling
 
-def find_surrounding_players(players, target_player):
-    # Find the position of the target player
-    positions = [(i, j) for i, row in enumerate(players) for j, player in enumerate(row) if player == target_player]
-
-    surrounding_players = set()
-    for x, y in positions:
-        # Check all surrounding cells
-        for dx in [-1, 0, 1]:
-            for dy in [-1, 0, 1]:
-                nx, ny = x + dx, y + dy
-                # Skip the target player itself
-                if (nx, ny) == (x, y):
-                    continue
-                # Check if the position is within the bounds of the array
-                if 0 <= nx < len(players) and 0 <= ny < len(players[0]):
-                    # Add the player to the set
-                    if players[nx][ny] != "blank" and players[nx][ny] != target_player:
-                        surrounding_players.add(players[nx][ny])
-
-    return list(surrounding_players)
+# video frames are kept within this many pixels (width, height) unless --tile says otherwise
+MAX_VIDEO_SIZE = (3840, 2160)
 
+def find_surrounding_players(players, target_player):
+    game_map = as_map(players)
+    opponents = game_map.adjacency.opponents(game_map.id_of(target_player))
+    return [game_map.name_of(player_id) for player_id in opponents]
 
-def check_winner(map):
-    flattened_map = [character for row in map for character in row if character != "blank"]
-    from collections import Counter
 
-    num_values = len(Counter(flattened_map).keys())
-    print(f'{num_values} players remaining')
+def check_winner(map, verbose=True):
+    num_values = len(as_map(map).ledger.tiles)
+    if verbose:
+        print(f'{num_values} players remaining')
     return num_values == 1
 
 #steps
@@ -39,47 +29,139 @@ def check_winner(map):
 # 2. choose random surrounding character
 # 3. declare battle and ask who wins
 # 4. update roster
-def step(map, simulate=False):
-    flattened_map = [character for row in map for character in row if character != "blank"]
-    attacking_player = random.choice(flattened_map)
-    surrounding_players = find_surrounding_players(map, attacking_player)
-    flattened_surrounding_players = np.reshape(surrounding_players, -1)
-    # if flattened_surrounding_players.count("blank") > 0:
-        # flattened_surrounding_players.remove("blank")
-    defending_player = random.choice(flattened_surrounding_players)
+# rng can be any random.Random, so games can be seeded and run side by side
+def step(map, simulate=False, rng=random, verbose=True):
+    map = as_map(map)
+    profiling.start_round()
+    with profiling.timer("step.attacker"):
+        attacking_player = map.name_of(map.ledger.sample(rng))
+    with profiling.timer("step.neighbours"):
+        surrounding_players = find_surrounding_players(map, attacking_player)
+        defending_player = rng.choice(surrounding_players)
 
-    attacking_player_count = flattened_map.count(attacking_player)
-    defending_player_count = flattened_map.count(defending_player)
-    print(f"{attacking_player} attacks {defending_player}")
-    advantage = calculate_advantage(attacking_player_count, defending_player_count)
-    print(f"{defending_player} player has handicap: {advantage}%")
+    with profiling.timer("step.advantage"):
+        attacking_player_count = map.count(attacking_player)
+        defending_player_count = map.count(defending_player)
+        advantage = calculate_advantage(attacking_player_count, defending_player_count)
+    if verbose:
+        print(f"{attacking_player} attacks {defending_player}")
+        print(f"{defending_player} player has handicap: {advantage}%")
     # declare battle
     # TODO: implement battle logic
     if simulate:
-        victor = random.choice(["A", "B"])
+        victor = rng.choice(["A", "B"])
     else:
         victor = input("Who won? A or B? ")
 
     winner = attacking_player if victor == "A" else defending_player
     loser = defending_player if victor == "A" else attacking_player
-    print(f"{winner} wins!")
+    if verbose:
+        print(f"{winner} wins!")
 
     losing_player_count = defending_player_count if victor == "A" else attacking_player_count
-    return update_map(map, winner, loser, losing_player_count), check_winner(map)
+    with profiling.timer("step.update_map"):
+        map = update_map(map, winner, loser, losing_player_count)
+    with profiling.timer("step.check_winner"):
+        is_over = check_winner(map, verbose)
+    return map, is_over
+
 
+def main(video_file="map_animation_cv2.mp4", save_png=False, map_file=None, profile_file=None,
+         render=True, headless=False, verbose=True, render_workers=None, archive_file=None,
+         seed=None, checkpoint_file=None, checkpoint_every=100, resume_file=None, tile=None):
+    # map_file is a board saved with game_map.save_map / map_generator.py; the roster otherwise.
+    # profile_file turns on the per-phase timers and saves them (.json or .csv) at the end.
+    # render=False plays the game without importing any of the rendering stack.
+    # render_workers=0 renders each frame inline; otherwise frames are rendered on a thread pool
+    # archive_file keeps every board as a tile-id grid (see frame_archive.py), with or without rendering
+    # checkpoint_file is rewritten every checkpoint_every rounds and at the end ("{round}" in the name
+    # keeps each one). resume_file continues a checkpoint exactly; with a seed as well it forks from it.
+    # tile is the pixels per cell in the video: by default full icons, or less to fit MAX_VIDEO_SIZE
+    if profile_file:
+        profiling.enable()
+    rounds = 0
+    rng = random.Random(seed)
+    if resume_file is not None:
+        map, rounds, saved_rng = load_checkpoint(resume_file)
+        if seed is None and saved_rng is not None:
+            rng = saved_rng
+    else:
+        map = as_map(map_file) if map_file is not None else Map.from_roster(starting_roster)
+    archive = FrameArchive(map.names, start_round=rounds) if archive_file else None
+    if archive is not None:
+        archive.append(map)
+
+    def advance():
+        nonlocal map, rounds
+        with profiling.timer("main.step"):
+            map, is_over = step(map, simulate=True, rng=rng, verbose=verbose)
+        rounds += 1
+        if archive is not None:
+            archive.append(map)
+        if checkpoint_file and (is_over or (checkpoint_every and rounds % checkpoint_every == 0)):
+            save_checkpoint(checkpoint_file.format(round=rounds), map, rounds, rng)
+        return is_over
+
+    is_over = map.ledger.winner() is not None
+    if not render:
+        while not is_over:
+            is_over = advance()
+    else:
+        import visualisations
+        if headless:
+            visualisations.set_headless()
+        tile = tile or fit_tile(*map.shape, *MAX_VIDEO_SIZE)
+        visualisations.set_tile(tile)
+        png_folder = "Maps" if save_png else None
+        # frames go straight into the video as they are rendered; Maps/*.png only if asked for
+        if render_workers == 0:
+            with visualisations.FrameRecorder(video_file, png_folder=png_folder) as recorder:
+                while not is_over:
+                    is_over = advance()
+                    with profiling.timer("main.render"):
+                        img = visualisations.plot_map(map, return_image=True)
+                    with profiling.timer("main.encode"):
+                        recorder.push(img)
+        else:
+            with visualisations.FrameRecorder(video_file) as recorder, \
+                    visualisations.RenderPool(recorder, workers=render_workers, png_folder=png_folder, tile=tile) as pool:
+                while not is_over:
+                    is_over = advance()
+                    with profiling.timer("main.submit"):
+                        pool.submit(map)
 
-def main():
-    map = starting_roster
-    count = 0
-    while True:
-        map, is_over = step(map, simulate=True)
-        if is_over:
-            print(f"Game over! Winner: {map[0][0]}")
-            plot_map(map, save=True, map_count=count)
-            plot_map_animation()
-            return
-        plot_map(map, save=True, map_count=count)
-        count += 1
+    print(f"Game over after {rounds} rounds! Winner: {map.name_of(map.ledger.winner())}")
+    if archive is not None:
+        save_archive(archive, archive_file)
+        print(f"Archive of {len(archive)} frames saved to: {archive_file}")
+    if profile_file:
+        profiling.export(profile_file)
+        print(f"Profile saved to: {profile_file}")
+    if render:
+        visualisations.plot_map_animation(video=video_file)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Simulate a game and record it as a video.")
+    parser.add_argument("--map", default=None, help="map file to start from (default: the character roster)")
+    parser.add_argument("--video", default="map_animation_cv2.mp4", help="where to write the video")
+    parser.add_argument("--save-png", action="store_true", help="also write every frame to Maps/")
+    parser.add_argument("--profile", default=None, help="time each phase and save the histograms (.json or .csv)")
+    parser.add_argument("--no-render", action="store_true", help="only simulate: no video, no window, no rendering imports")
+    parser.add_argument("--headless", action="store_true", help="record the video but never open a window")
+    parser.add_argument("--quiet", action="store_true", help="don't print every round")
+    parser.add_argument("--render-workers", type=int, default=None,
+                        help="threads rendering frames in the background (0: render inline; default: all cores)")
+    parser.add_argument("--archive", default=None,
+                        help="save every board as tile ids (.npz), for frame_archive.py to export later")
+    parser.add_argument("--seed", type=int, default=None, help="seed the game (with --resume: fork with this seed)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="write a checkpoint here every --checkpoint-every rounds; {round} in the name keeps them all")
+    parser.add_argument("--checkpoint-every", type=int, default=100)
+    parser.add_argument("--resume", default=None, help="continue from a checkpoint instead of a fresh map")
+    parser.add_argument("--tile", type=int, choices=LOD_TILE_SIZES, default=None,
+                        help="pixels per cell in the video (default: 64, smaller if a frame would exceed 3840x2160)")
+    args = parser.parse_args()
+    main(video_file=args.video, save_png=args.save_png, map_file=args.map, profile_file=args.profile,
+         render=not args.no_render, headless=args.headless, verbose=not args.quiet,
+         render_workers=args.render_workers, archive_file=args.archive,
+         seed=args.seed, checkpoint_file=args.checkpoint, checkpoint_every=args.checkpoint_every, resume_file=args.resume, tile=args.tile)
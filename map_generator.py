@@ -0,0 +1,59 @@
+#builds large boards from the roster and saves them in the map file format (see game_map.save_map)
+
+import argparse
+import numpy as np
+
+from character_roster import roster
+from game_map import BLANK_ID, Map, save_map
+
+
+def roster_grid(shuffle=False, seed=0):
+    # the 7x13 roster as ids, optionally with the characters shuffled between the non-blank cells
+    base = Map.from_roster(roster)
+    grid = base.grid.copy()
+    if shuffle:
+        filled = grid != BLANK_ID
+        grid[filled] = np.random.default_rng(seed).permutation(grid[filled])
+    return grid, base.names
+
+
+def scaled_map(height, width, shuffle=False, seed=0):
+    # every roster cell stretched into a block, so each character starts with a patch of tiles
+    grid, names = roster_grid(shuffle, seed)
+    rows = np.arange(height) * grid.shape[0] // height
+    cols = np.arange(width) * grid.shape[1] // width
+    return Map(grid[rows[:, None], cols[None, :]], names)
+
+
+def tiled_map(height, width, shuffle=False, seed=0):
+    # the roster repeated across the board, so each character starts with several separate tiles
+    grid, names = roster_grid(shuffle, seed)
+    reps = (-(-height // grid.shape[0]), -(-width // grid.shape[1]))
+    return Map(np.tile(grid, reps)[:height, :width], names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a board from the roster and save it as a map file.")
+    parser.add_argument("output", help="where to write the map (.npz)")
+    parser.add_argument("--size", default=None, help="board size as HxW, e.g. 140x260")
+    parser.add_argument("--block", type=int, default=None, help="instead of --size: each character gets a BLOCKxBLOCK patch")
+    parser.add_argument("--mode", choices=["scale", "tile"], default="scale")
+    parser.add_argument("--shuffle", action="store_true", help="shuffle where the characters start")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.block is not None:
+        height, width = len(roster) * args.block, len(roster[0]) * args.block
+    elif args.size is not None:
+        height, width = (int(n) for n in args.size.lower().split("x"))
+    else:
+        parser.error("pass --size or --block")
+
+    make = scaled_map if args.mode == "scale" else tiled_map
+    game_map = make(height, width, args.shuffle, args.seed)
+    save_map(game_map, args.output)
+    print(f"{height}x{width} map with {len(game_map.players())} players saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#opt-in per-phase timers for the game loop and renderers. Off unless SMASH_PROFILE=1 or enable() is called;
+#when off, timer() hands back one shared no-op context manager so the cost is a function call.
+#The on/off switch and the current round's breakdown belong to a Recorder, so each Streamlit session can
+#have its own (see recording()); the histograms are process-wide.
+
+import contextlib
+import contextvars
+import csv
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# phase -> {"count", "total", "min", "max", "histogram": {bucket: count}}; buckets are powers of two in microseconds
+_stats = {}
+_stats_lock = threading.Lock()  # timers also run on render worker threads
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Recorder:
+    def __init__(self, enabled=None):
+        self.enabled = os.environ.get("SMASH_PROFILE") == "1" if enabled is None else enabled
+        # phase -> seconds spent in the current round (since the last start_round())
+        self.last_round = {}
+
+
+# used wherever recording() hasn't set another one: the CLI tools, and threads they start
+_default = Recorder()
+_current = contextvars.ContextVar("profiling_recorder", default=_default)
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def recording(recorder):
+    # with profiling.recording(session_recorder): ... times into recorder in this thread
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+
+def enable(on=True):
+    current().enabled = on
+
+
+def is_enabled():
+    return current().enabled
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+    current().last_round.clear()
+
+
+def start_round():
+    current().last_round.clear()
+
+
+def record(phase, seconds, recorder=None):
+    with _stats_lock:
+        stats = _stats.get(phase)
+        if stats is None:
+            stats = _stats[phase] = {"count": 0, "total": 0.0, "min": math.inf, "max": 0.0, "histogram": {}}
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["min"] = min(stats["min"], seconds)
+        stats["max"] = max(stats["max"], seconds)
+        bucket = 1 << max(0, math.ceil(math.log2(max(seconds * 1e6, 1))))
+        stats["histogram"][bucket] = stats["histogram"].get(bucket, 0) + 1
+        last_round = (recorder or current()).last_round
+        last_round[phase] = last_round.get(phase, 0.0) + seconds
+
+
+class _Timer:
+    __slots__ = ("phase", "recorder", "start")
+
+    def __init__(self, phase, recorder):
+        self.phase = phase
+        self.recorder = recorder
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.phase, time.perf_counter() - self.start, self.recorder)
+
+
+def timer(phase):
+    # with profiling.timer("step.update_map"): ...
+    recorder = current()
+    if not recorder.enabled:
+        return _NULL_TIMER
+    return _Timer(phase, recorder)
+
+
+def timed(phase):
+    # decorator form of timer()
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = current()
+            if not recorder.enabled:
+                return func(*args, **kwargs)
+            with _Timer(phase, recorder):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary():
+    with _stats_lock:
+        snapshot = {phase: dict(stats, histogram=dict(stats["histogram"])) for phase, stats in _stats.items()}
+    out = {}
+    for phase, stats in sorted(snapshot.items()):
+        out[phase] = {
+            "count": stats["count"],
+            "total_s": stats["total"],
+            "mean_ms": stats["total"] / stats["count"] * 1000,
+            "min_ms": stats["min"] * 1000,
+            "max_ms": stats["max"] * 1000,
+            "histogram_us": {str(bucket): n for bucket, n in sorted(stats["histogram"].items())},
+        }
+    return out
+
+
+def export_json(path):
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=2)
+
+
+def export_csv(path):
+    # one row per (phase, histogram bucket); bucket_us is the bucket's upper bound
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["phase", "bucket_us", "count", "phase_count", "phase_total_s", "phase_mean_ms"])
+        for phase, stats in summary().items():
+            for bucket, n in stats["histogram_us"].items():
+                writer.writerow([phase, bucket, n, stats["count"], stats["total_s"], stats["mean_ms"]])
+
+
+def export(path):
+    # picks the format from the file extension
+    if path.endswith(".csv"):
+        export_csv(path)
+    else:
+        export_json(path)
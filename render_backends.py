@@ -0,0 +1,181 @@
+#interchangeable pixel backends behind one interface. Frames are always composed the same way (the shared
+#icon atlas and highlight overlays gathered by rendering.MapRenderer), so every backend produces identical
+#pixels (tests/test_render_backends.py checks it); they differ in how a frame is encoded and in what they need
+#installed: "numpy" only numpy and zlib, "cv2" opencv, "pil" Pillow. The fastest one is picked on first use.
+
+import io
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+# PNG compression for every backend: frames are flat icon tiles, so level 1 is nearly as small as 9
+PNG_COMPRESS_LEVEL = 1
+# set SMASH_RENDER_BACKEND to skip the startup benchmark and always use that backend
+FORCED_BACKEND = os.environ.get("SMASH_RENDER_BACKEND")
+# set SMASH_RENDER_BACKEND_CACHE to a file to keep the benchmark's result; later starts with the same
+# backend versions installed reuse it instead of timing them again
+SELECTION_CACHE = os.environ.get("SMASH_RENDER_BACKEND_CACHE")
+
+
+class NumpyBackend:
+    name = "numpy"
+    version = f"numpy {np.__version__}, zlib {zlib.ZLIB_RUNTIME_VERSION}"
+
+    def encode_png(self, frame):
+        # unfiltered RGB scanlines through zlib: no imaging library needed
+        height, width, _ = frame.shape
+        raw = np.empty((height, width * 3 + 1), dtype=np.uint8)
+        raw[:, 0] = 0  # filter type "none" for every row
+        raw[:, 1:] = frame.reshape(height, width * 3)
+
+        def chunk(tag, data):
+            return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+        header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)  # 8-bit RGB
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+                + chunk(b"IDAT", zlib.compress(raw.tobytes(), PNG_COMPRESS_LEVEL)) + chunk(b"IEND", b""))
+
+    def decode_png(self, data):
+        return None  # can't read PNGs written by others
+
+    def write_png(self, frame, path):
+        with open(path, "wb") as f:
+            f.write(self.encode_png(frame))
+
+
+class Cv2Backend(NumpyBackend):
+    name = "cv2"
+
+    def __init__(self):
+        import cv2
+        self.cv2 = cv2
+        self.version = f"opencv {cv2.__version__}"
+
+    def encode_png(self, frame):
+        ok, data = self.cv2.imencode(".png", np.ascontiguousarray(frame[..., ::-1]),
+                                     [self.cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESS_LEVEL])
+        if not ok:
+            raise ValueError("cv2 could not encode the frame")
+        return data.tobytes()
+
+    def decode_png(self, data):
+        return self.cv2.imdecode(np.frombuffer(data, dtype=np.uint8), self.cv2.IMREAD_COLOR)[..., ::-1]
+
+
+class PilBackend(NumpyBackend):
+    name = "pil"
+
+    def __init__(self):
+        import PIL
+        from PIL import Image
+        self.Image = Image
+        self.version = f"Pillow {PIL.__version__}"
+
+    def encode_png(self, frame):
+        buffer = io.BytesIO()
+        self.Image.fromarray(frame).save(buffer, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+        return buffer.getvalue()
+
+    def decode_png(self, data):
+        return np.array(self.Image.open(io.BytesIO(data)).convert("RGB"))
+
+
+BACKENDS = {"numpy": NumpyBackend, "cv2": Cv2Backend, "pil": PilBackend}
+
+_available = None
+_selected = None
+# how the current backend was chosen: {"backend", "forced", "cached", "seconds_per_frame": {name: s}}
+selection = {}
+
+
+def available_backends():
+    # name -> backend, for every backend whose library can be imported
+    global _available
+    if _available is None:
+        _available = {}
+        for name, cls in BACKENDS.items():
+            try:
+                _available[name] = cls()
+            except ImportError:
+                pass
+    return _available
+
+
+def sample_frame():
+    # the roster board with a selection, as the shared renderer draws it
+    from character_roster import roster
+    from game_map import Map
+    from rendering import MapRenderer
+
+    game_map = Map.from_roster(roster)
+    players = [game_map.name_of(p) for p in game_map.players()]
+    return MapRenderer().render(game_map, players[0], players[-1])
+
+
+def time_backend(backend, frame):
+    # seconds to encode frame once, after one warm-up encode
+    backend.encode_png(frame)
+    start = time.perf_counter()
+    backend.encode_png(frame)
+    return time.perf_counter() - start
+
+
+def cached_timings(path, backends):
+    # the timings saved in path, if they were taken with exactly these backend versions
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if saved.get("versions") != {name: backend.version for name, backend in backends.items()}:
+        return None
+    return saved.get("seconds_per_frame")
+
+
+def save_timings(path, backends, timings):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path, "w") as f:
+        json.dump({"versions": {name: backend.version for name, backend in backends.items()},
+                   "seconds_per_frame": timings}, f, indent=2)
+
+
+def select_backend(name=None, cache=None):
+    # name (or SMASH_RENDER_BACKEND) picks a backend outright; otherwise the fastest one, timed on one frame
+    # or read back from cache (default SMASH_RENDER_BACKEND_CACHE)
+    global _selected
+    name = name or FORCED_BACKEND
+    cache = cache if cache is not None else SELECTION_CACHE
+    backends = available_backends()
+    if name:
+        if name not in backends:
+            raise ValueError(f"render backend {name!r} is not available here (have: {', '.join(backends)})")
+        _selected = backends[name]
+        selection.clear()
+        selection.update(backend=name, forced=True, cached=False, seconds_per_frame={})
+        return _selected
+
+    timings = cached_timings(cache, backends) if cache else None
+    cached = timings is not None
+    if not cached:
+        frame = sample_frame()
+        timings = {n: time_backend(backend, frame) for n, backend in backends.items()}
+        if cache:
+            save_timings(cache, backends, timings)
+    fastest = min(timings, key=timings.get)
+    _selected = backends[fastest]
+    selection.clear()
+    selection.update(backend=fastest, forced=False, cached=cached, seconds_per_frame=timings)
+    return _selected
+
+
+def get_backend():
+    # the backend chosen for this process, selecting one on the first call
+    if _selected is None:
+        select_backend()
+    return _selected
@@ -0,0 +1,150 @@
+#stateful board renderer: keeps the last frame and only redraws the cells that changed.
+#Highlighting is an overlay: tinted copies of the atlas are built once, so a highlighted cell is
+#another atlas lookup and nothing gets blended per frame.
+
+import numpy as np
+from icon_atlas import ICON_SIZE, LOD_TILE_SIZES, compose_frame, downsample_atlas, icon_atlas, tile_view
+from shared_resources import render_cache
+
+NO_HIGHLIGHT = 0
+ATTACKER = 1
+DEFENDER = 2
+
+# red attacker, blue defender, blended 40% over the icon
+ATTACKER_COLOR = (255, 0, 0)
+DEFENDER_COLOR = (0, 0, 255)
+HIGHLIGHT_ALPHA = 0.4
+
+
+def tint_tiles(tiles, color, alpha=HIGHLIGHT_ALPHA):
+    # the same arithmetic as PIL's Image.blend against a solid colour, without needing PIL
+    tiles = np.asarray(tiles, dtype=np.float64)
+    return (tiles + alpha * (np.asarray(color, dtype=np.float64) - tiles)).clip(0, 255).astype(np.uint8)
+
+
+def highlight_atlas(atlas, tint, attacker_color, defender_color):
+    # atlas followed by its attacker-tinted and defender-tinted copies: cell id + mark * len(atlas)
+    return np.concatenate([atlas, tint(atlas, attacker_color), tint(atlas, defender_color)])
+
+
+def fit_tile(rows, cols, max_width, max_height):
+    # the largest level-of-detail tile size at which a rows x cols board fits in max_width x max_height pixels
+    for tile in LOD_TILE_SIZES:
+        if cols * tile <= max_width and rows * tile <= max_height:
+            return tile
+    return LOD_TILE_SIZES[-1]
+
+
+def visible_cells(rows, cols, tile, max_width, max_height):
+    # how many rows and columns of the board fit on screen at this tile size
+    return min(rows, max(1, max_height // tile)), min(cols, max(1, max_width // tile))
+
+
+def highlighted_ids(grid, marks, n_names):
+    return grid + marks.astype(grid.dtype) * n_names
+
+
+def cell_index(grid, n_names):
+    # (order, starts): the flat indices of id k's cells are order[starts[k]:starts[k + 1]], in row-major order
+    flat = grid.ravel()
+    order = np.argsort(flat, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(np.bincount(flat, minlength=n_names))))
+    return order, starts
+
+
+def highlight_marks(game_map, attacker=None, defender=None, grid=None):
+    # per-cell highlight: the attacker's tiles, then the defender's. grid defaults to game_map's own.
+    grid = game_map.grid if grid is None else grid
+    marks = np.zeros(grid.shape, dtype=np.int8)
+    if defender in game_map.ids:
+        marks[grid == game_map.id_of(defender)] = DEFENDER
+    if attacker in game_map.ids:
+        marks[grid == game_map.id_of(attacker)] = ATTACKER
+    return marks
+
+
+class MapRenderer:
+    def __init__(self, atlas_for=icon_atlas, tint=tint_tiles, attacker_color=ATTACKER_COLOR,
+                 defender_color=DEFENDER_COLOR, tile=ICON_SIZE):
+        # atlas_for(names) -> icon atlas, tint(tiles, color) -> highlighted copies of a stack of tiles.
+        # tile is the level of detail: each cell is drawn tile x tile pixels (see icon_atlas.LOD_TILE_SIZES)
+        self.atlas_for = atlas_for
+        self.tint = tint
+        self.colors = {ATTACKER: attacker_color, DEFENDER: defender_color}
+        self.tile = tile
+        self.frame = None
+        self.grid = None
+        self.marks = None
+        self.names = None
+        self.highlighted = np.empty(0, dtype=np.intp)  # flat indices of the cells marked in self.marks
+        self.cells = None  # cell_index of self.grid, built by the first highlight() after a render
+        self.changed_cells = []
+
+    def overlay_atlas(self, names, tile=None):
+        # kept in the process-wide render cache, so every renderer with the same icons and tint shares it.
+        # Smaller tiles are the full-size overlay atlas shrunk, so a highlight looks the same at every zoom.
+        tile = self.tile if tile is None else tile
+        key = ("highlight", self.atlas_for, self.tint, self.colors[ATTACKER], self.colors[DEFENDER],
+               tuple(names), tile)
+
+        def build():
+            if tile == ICON_SIZE:
+                return highlight_atlas(self.atlas_for(names), self.tint, self.colors[ATTACKER], self.colors[DEFENDER])
+            return downsample_atlas(self.overlay_atlas(names, ICON_SIZE), tile)
+
+        return render_cache().get(key, build)
+
+    def render(self, game_map, attacker=None, defender=None, grid=None):
+        # returns the renderer's own frame buffer; copy it if it has to outlive the next render.
+        # changed_cells lists the (row, col) cells that were redrawn, [] if the frame is unchanged.
+        # grid defaults to game_map's own; pass a part of it (a viewport) to draw just that.
+        grid = game_map.grid if grid is None else grid
+        marks = highlight_marks(game_map, attacker, defender, grid=grid)
+        atlas = self.overlay_atlas(game_map.names)
+
+        if self.frame is None or self.grid.shape != grid.shape or self.names != game_map.names:
+            self.frame = compose_frame(highlighted_ids(grid, marks, len(game_map.names)), atlas)
+            self.changed_cells = [(i, j) for i in range(grid.shape[0]) for j in range(grid.shape[1])]
+        else:
+            self._redraw(atlas, grid, marks, *np.nonzero((grid != self.grid) | (marks != self.marks)))
+
+        self.grid = grid.copy()
+        self.marks = marks
+        self.names = list(game_map.names)
+        self.highlighted = np.flatnonzero(marks)
+        self.cells = None
+        return self.frame
+
+    def highlight(self, game_map, attacker=None, defender=None):
+        # move the highlight on the board from the last render without looking at the rest of it: the
+        # attacker's and defender's cells come from an index of the grid by id, and only they and the
+        # previously highlighted cells are redrawn. Falls back to render() if nothing is drawn yet.
+        if self.frame is None or self.names != game_map.names:
+            return self.render(game_map, attacker, defender)
+        if self.cells is None:
+            self.cells = cell_index(self.grid, len(self.names))
+        order, starts = self.cells
+
+        def cells_of(name):
+            player_id = game_map.ids.get(name)
+            return order[starts[player_id]:starts[player_id + 1]] if player_id is not None else order[:0]
+
+        marked = {DEFENDER: cells_of(defender), ATTACKER: cells_of(attacker)}
+        dirty = np.concatenate([self.highlighted, *marked.values()])
+        self.marks.flat[self.highlighted] = NO_HIGHLIGHT
+        for mark, cells in marked.items():  # the attacker last, like highlight_marks
+            self.marks.flat[cells] = mark
+        self.highlighted = np.concatenate(list(marked.values()))
+        rows, cols = np.divmod(np.unique(dirty), self.grid.shape[1])
+        self._redraw(self.overlay_atlas(self.names), self.grid, self.marks, rows, cols)
+        return self.frame
+
+    def _redraw(self, atlas, grid, marks, rows, cols):
+        tiles = tile_view(self.frame, *grid.shape)
+        tiles[rows, :, cols] = atlas[highlighted_ids(grid[rows, cols], marks[rows, cols], len(atlas) // 3)]
+        self.changed_cells = list(zip(rows.tolist(), cols.tolist()))
+
+
+def overlay_atlas(names, tile=ICON_SIZE):
+    # the shared icon atlas with its highlight overlays, as every default MapRenderer uses it
+    return MapRenderer().overlay_atlas(names, tile)
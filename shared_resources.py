@@ -0,0 +1,84 @@
+#process-wide, read-only render resources (highlight atlases, board frames, encoded PNGs) shared by every
+#session, held in an LRU with a byte budget so a busy server can't grow without bound
+
+import collections
+import os
+import threading
+
+# SMASH_SHARED_CACHE_MB sets the default budget
+DEFAULT_MAX_BYTES = int(float(os.environ.get("SMASH_SHARED_CACHE_MB", "256")) * 1024 * 1024)
+# SMASH_ENCODED_CACHE_MB sets the budget for frames already encoded as PNG
+ENCODED_MAX_BYTES = int(float(os.environ.get("SMASH_ENCODED_CACHE_MB", "64")) * 1024 * 1024)
+
+
+class ResourceCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()  # key -> value, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        # the cached value for key, built with build() on a miss. Values are arrays, handed out read-only
+        # since other sessions see the same object, or anything immutable with an nbytes size; two sessions
+        # missing at once may both build, the last one wins.
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        if hasattr(value, "flags"):
+            value.flags.writeable = False
+        if value.nbytes > self.max_bytes:
+            return value  # never fits, don't flush everything else for it
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_render_cache = None
+
+
+def render_cache():
+    # the process-wide cache the renderers keep their icon and highlight atlases in; it is their only
+    # owner, so whatever the byte budget evicts is really freed
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = ResourceCache()
+    return _render_cache
@@ -0,0 +1,149 @@
+#headless batch runner: plays many simulated games with no rendering or printing
+
+import argparse
+import json
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from character_roster import roster as starting_roster
+from game_map import as_map
+from main import step
+from lockstep import play_games
+
+# games per lockstep batch: big enough to keep the array work busy, small enough to stay in cache
+LOCKSTEP_BATCH = 1000
+
+
+def play_game(seed, players=None, max_rounds=None):
+    # one full game from a fresh copy of the map, driven only by its own seeded rng.
+    # players can be a roster list, a Map or a map file path
+    map = as_map(players if players is not None else starting_roster).copy()
+    rng = random.Random(seed)
+    alive = set(map.ledger.tiles)
+    eliminated = []
+    rounds = 0
+    is_over = map.ledger.winner() is not None
+
+    while not is_over and (max_rounds is None or rounds < max_rounds):
+        map, is_over = step(map, simulate=True, rng=rng, verbose=False)
+        rounds += 1
+        # the loser is knocked out once its last tile is taken
+        if len(map.ledger.tiles) < len(alive):
+            for player_id in sorted(alive - set(map.ledger.tiles)):
+                eliminated.append(map.name_of(player_id))
+            alive = set(map.ledger.tiles)
+
+    winner = map.ledger.winner()
+    return {
+        "seed": seed,
+        "winner": map.name_of(winner) if winner is not None else None,
+        "rounds": rounds,
+        "eliminated": eliminated,
+    }
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def _play_batch(args):
+    return play_games(*args)
+
+
+def summarise(games):
+    # aggregate per-game results into win rates, game lengths and elimination order
+    n_games = len(games)
+    wins = Counter(game["winner"] for game in games if game["winner"] is not None)
+    lengths = np.array([game["rounds"] for game in games])
+
+    # position 1 is the first player knocked out
+    positions = {}
+    for game in games:
+        for position, player in enumerate(game["eliminated"], start=1):
+            positions.setdefault(player, []).append(position)
+
+    return {
+        "games": n_games,
+        "win_rates": {player: wins[player] / n_games for player in sorted(wins, key=lambda p: (-wins[p], p))},
+        "game_length": {
+            "mean": float(lengths.mean()) if n_games else 0.0,
+            "min": int(lengths.min()) if n_games else 0,
+            "max": int(lengths.max()) if n_games else 0,
+            "percentiles": {str(q): float(np.percentile(lengths, q)) for q in (5, 25, 50, 75, 95)} if n_games else {},
+            "histogram": {str(rounds): n for rounds, n in sorted(Counter(lengths.tolist()).items())},
+        },
+        "mean_elimination_position": {
+            player: float(np.mean(found)) for player, found in sorted(positions.items(), key=lambda item: np.mean(item[1]))
+        },
+    }
+
+
+def simulate_many(n_games=None, seeds=None, workers=None, players=None, max_rounds=None, include_games=False,
+                  engine="step", batch_size=LOCKSTEP_BATCH):
+    # seeds default to 0..n_games-1; the summary only depends on the seed list, not on workers.
+    # engine="lockstep" plays batch_size games at a time as one array (lockstep.py): same rules, much
+    # faster, but each seed gives a different game than it does under engine="step"
+    if seeds is None:
+        if n_games is None:
+            raise ValueError("pass n_games or seeds")
+        seeds = list(range(n_games))
+    else:
+        seeds = list(seeds)
+        if n_games is not None and n_games != len(seeds):
+            raise ValueError(f"n_games={n_games} but {len(seeds)} seeds were given")
+
+    if engine == "lockstep":
+        play, jobs = _play_batch, [(seeds[i:i + batch_size], players, max_rounds)
+                                   for i in range(0, len(seeds), batch_size)]
+    elif engine == "step":
+        play, jobs = _play, [(seed, players, max_rounds) for seed in seeds]
+    else:
+        raise ValueError(f"unknown engine: {engine!r}")
+
+    if workers == 1 or len(jobs) == 1:
+        results = [play(job) for job in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(play, jobs, chunksize=chunksize))
+    games = [game for batch in results for game in batch] if engine == "lockstep" else results
+
+    summary = summarise(games)
+    if include_games:
+        summary["results"] = games
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many simulated games and report win rates.")
+    parser.add_argument("--games", type=int, default=1000, help="number of games to play")
+    parser.add_argument("--seed", type=int, default=0, help="first seed; game i uses seed + i")
+    parser.add_argument("--map", default=None, help="map file to start from (default: the character roster); "
+                                                     "a main.py checkpoint forks every game from that position")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-rounds", type=int, default=None, help="stop a game after this many rounds")
+    parser.add_argument("--output", default=None, help="write the summary as JSON to this file")
+    parser.add_argument("--include-games", action="store_true", help="include every game's result in the output")
+    parser.add_argument("--engine", choices=["step", "lockstep"], default="step",
+                        help="step: one main.step per game per round; lockstep: batches of games advanced as one array")
+    parser.add_argument("--batch-size", type=int, default=LOCKSTEP_BATCH, help="games per lockstep batch")
+    args = parser.parse_args()
+
+    seeds = range(args.seed, args.seed + args.games)
+    summary = simulate_many(seeds=seeds, workers=args.workers, players=args.map, max_rounds=args.max_rounds,
+                            include_games=args.include_games, engine=args.engine, batch_size=args.batch_size)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary saved to: {args.output}")
+    else:
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
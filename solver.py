@@ -0,0 +1,198 @@
+#exact win probabilities for small boards: main.step's random process solved as an absorbing Markov chain.
+#The rules never look at who a player is, only at where their tiles are, so boards are canonicalized by
+#renumbering players in order of first appearance and every relabelling of a board is one state.
+
+import heapq
+import time
+
+import numpy as np
+
+from game_map import BLANK_ID, as_map
+from utils import closest_cells, players_to_lose_for, squared_distance_to
+
+# the linear system is solved directly up to this many unknowns, iteratively above it
+DENSE_LIMIT = 2000
+
+
+def canonical(grid):
+    # (grid with the players renumbered 1, 2, ... in row-major order of first appearance, ids) where
+    # ids[k] is the id label k had in grid; blank stays 0
+    present, first = np.unique(grid, return_index=True)
+    order = present[np.argsort(first)]
+    ids = np.concatenate(([BLANK_ID], order[order != BLANK_ID]))
+    relabel = np.zeros(int(present[-1]) + 1, dtype=grid.dtype)
+    relabel[ids] = np.arange(len(ids))
+    return relabel[grid], ids
+
+
+def bordering(grid, n_labels):
+    # (n_labels, n_labels) bool: which players touch (8 ways); blank cells never border anyone
+    touch = np.zeros((n_labels, n_labels), dtype=bool)
+    for a, b in ((grid[:, :-1], grid[:, 1:]), (grid[:-1], grid[1:]),
+                 (grid[:-1, :-1], grid[1:, 1:]), (grid[:-1, 1:], grid[1:, :-1])):
+        touch[a.ravel(), b.ravel()] = True
+    touch |= touch.T
+    touch[BLANK_ID] = touch[:, BLANK_ID] = False
+    np.fill_diagonal(touch, False)
+    return touch
+
+
+def conquer(grid, winner, loser, losing_count):
+    # utils.update_map on a bare id grid: a changed copy, the Map and its indexes are never built
+    loser_flat = np.flatnonzero(grid == loser)
+    rows, cols = np.divmod(loser_flat, grid.shape[1])
+    chosen = closest_cells(squared_distance_to(grid == winner, rows, cols), loser_flat,
+                           players_to_lose_for(losing_count))
+    after = grid.copy()
+    after.flat[loser_flat[chosen]] = winner
+    return after
+
+
+def transitions(grid, n_labels, win_probability):
+    # [(probability, next_grid)] for one round of main.step from a canonical grid with players 1..n_labels-1.
+    # Attackers are weighted by tile count like step's uniform tile choice; an attacker with no
+    # neighbours can't fight, so the choice is renormalised over the ones that can.
+    counts = np.bincount(grid.ravel(), minlength=n_labels)
+    touch = bordering(grid, n_labels)
+    attackers = [a for a in range(1, n_labels) if touch[a].any()]
+    total = sum(int(counts[a]) for a in attackers)
+    conquered = {}  # (winner, loser) -> grid; a attacking b and losing ends like b attacking a and winning
+    out = []
+    for attacker in attackers:
+        defenders = np.flatnonzero(touch[attacker]).tolist()
+        for defender in defenders:
+            p_pick = counts[attacker] / total / len(defenders)
+            p_win = (win_probability(int(counts[attacker]), int(counts[defender])) if callable(win_probability)
+                     else win_probability)
+            for p, winner, loser in ((p_win, attacker, defender), (1 - p_win, defender, attacker)):
+                if p > 0:
+                    if (winner, loser) not in conquered:
+                        conquered[winner, loser] = conquer(grid, winner, loser, int(counts[loser]))
+                    out.append((p_pick * p, conquered[winner, loser]))
+    return out
+
+
+def explore(start, win_probability, max_states, max_seconds=None):
+    # the canonical boards reachable from start (a canonical grid), likeliest first, and for each one
+    # explored the moves out of it as (probability, next_state, ids): ids[k] is the label, in this board,
+    # of the next board's player k. Boards found but not explored within max_states or max_seconds keep
+    # moves None. Boards are explored in order of the probability that has flowed into them so far,
+    # so a budget is spent on the lines of play that matter most.
+    deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+    keys = {start.tobytes(): 0}
+    grids = [start]
+    moves = [None]
+    inflow = [1.0]
+    queue = [(-1.0, 0)]
+    explored = 0
+    while queue and explored < max_states and (deadline is None or time.perf_counter() < deadline):
+        _, index = heapq.heappop(queue)
+        if moves[index] is not None:
+            continue  # a stale entry: the board was explored from a newer one with more inflow
+        grid = grids[index]
+        out = []
+        for p, after in transitions(grid, int(grid.max()) + 1, win_probability):
+            after, ids = canonical(after)
+            key = after.tobytes()
+            state = keys.get(key)
+            if state is None:
+                state = keys[key] = len(grids)
+                grids.append(after)
+                moves.append([] if len(ids) <= 2 else None)  # one player left: nothing to explore
+                inflow.append(0.0)
+            if moves[state] is None:
+                inflow[state] += inflow[index] * p
+                heapq.heappush(queue, (-inflow[state], state))
+            out.append((p, state, ids))
+        moves[index] = out
+        explored += 1
+    return grids, moves
+
+
+def solve_absorbing(n, rows, cols, probs, rewards, tol=1e-13, max_iter=1_000_000):
+    # x = Q x + rewards for n unknowns, Q given by its (rows, cols, probs) entries; rewards has one
+    # column per quantity
+    if n <= DENSE_LIMIT:
+        q = np.zeros((n, n))
+        np.add.at(q, (rows, cols), probs)
+        return np.linalg.solve(np.eye(n) - q, rewards)
+
+    x = rewards.copy()
+    for _ in range(max_iter):
+        new = np.stack([np.bincount(rows, weights=probs * x[cols, c], minlength=n)
+                        for c in range(rewards.shape[1])], axis=1) + rewards
+        if np.max(np.abs(new - x)) < tol * max(1.0, np.max(np.abs(new))):
+            return new
+        x = new
+    raise RuntimeError("solver did not converge")
+
+
+def edge_arrays(edges):
+    if not edges:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+    rows, cols, probs = zip(*edges)
+    return np.array(rows), np.array(cols), np.array(probs, dtype=float)
+
+
+def solve(map, win_probability=0.5, max_states=20000, max_seconds=None, tolerance=0.0):
+    # win_probability is the chance the attacker wins a battle: a number, or a function of
+    # (attacker_count, defender_count). Returns each player's chance of winning and the expected
+    # number of rounds left. Boards where nobody can reach an opponent end with no winner.
+    # At most max_states boards are explored (and for at most max_seconds). If that leaves some lines of
+    # play undecided, "unresolved" is their total probability: each player's true chance lies between
+    # its win_probability and that much more, and expected_rounds only counts rounds until they leave
+    # the explored boards. Raises ValueError if more than tolerance is unresolved.
+    start = as_map(map)
+    players = start.players()
+    grid, start_ids = canonical(start.grid)
+    grids, moves = explore(grid, win_probability, max_states, max_seconds)
+    explored = sum(out is not None for out in moves)
+    if tolerance == 0 and explored < len(grids):
+        raise ValueError(f"more than {explored:,} reachable boards; too big to solve exactly")
+
+    transient = [s for s, out in enumerate(moves) if out]
+    if not transient:
+        final = start.ledger.winner()
+        odds = {start.name_of(p): float(p == final) for p in players}
+        return {"win_probability": odds, "expected_rounds": 0.0, "unresolved": 0.0, "states": explored}
+
+    # rounds left and the chance of leaving the explored boards: one unknown per transient board
+    position = np.full(len(grids), -1)
+    position[transient] = np.arange(len(transient))
+    per_board = np.zeros((len(transient), 2))
+    per_board[:, 0] = 1.0
+    edges = []
+    for s in transient:
+        for p, t, _ in moves[s]:
+            if position[t] >= 0:
+                edges.append((position[s], position[t], p))
+            elif moves[t] is None:
+                per_board[position[s], 1] += p
+    rounds, unresolved = solve_absorbing(len(transient), *edge_arrays(edges), per_board)[0]
+    if unresolved > tolerance:
+        raise ValueError(f"{unresolved:.1%} of outcomes still undecided after {explored:,} boards; "
+                         "too big to solve exactly")
+
+    # win chances: one unknown per (transient board, player label), label k of board s at offset[s] + k - 1.
+    # A move carries label j of s to label k of the next board, where that board's ids[k] == j.
+    labels = np.array([int(grids[s].max()) for s in transient])
+    offset = np.full(len(grids), -1)
+    offset[transient] = np.concatenate(([0], np.cumsum(labels)[:-1]))
+    n = int(labels.sum())
+    rewards = np.zeros((n, 1))
+    edges = []
+    for s in transient:
+        for p, t, ids in moves[s]:
+            if offset[t] >= 0:
+                edges.extend((offset[s] + ids[k] - 1, offset[t] + k - 1, p) for k in range(1, len(ids)))
+            elif moves[t] is not None and len(ids) == 2:
+                rewards[offset[s] + ids[1] - 1] += p  # the next board has one player left: ids[1] won
+    wins = solve_absorbing(n, *edge_arrays(edges), rewards)[:, 0]
+
+    odds = {int(start_ids[k]): float(wins[k - 1]) for k in range(1, len(start_ids))}
+    return {
+        "win_probability": {start.name_of(p): odds[p] for p in players},
+        "expected_rounds": float(rounds),
+        "unresolved": float(max(unresolved, 0.0)),
+        "states": explored,
+    }
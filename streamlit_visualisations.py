@@ -1,70 +1,153 @@
 #a seperate visualisations script with minimal dependencies
 
-from PIL import Image, ImageDraw, ImageOps
+from PIL import Image
 import numpy as np
+import hashlib
 import os
+import threading
 from character_roster import roster
+from game_map import as_map, ROSTER_NAMES
+from icon_atlas import compose_frame, decode_icon, icon_atlas as shared_icon_atlas
+from rendering import ATTACKER_COLOR, HIGHLIGHT_ALPHA, MapRenderer, overlay_atlas, tint_tiles
+from render_backends import get_backend
+import profiling
 
 ICON_SIZE = (64, 64)
 
+def decode_character_icon(character):
+    return Image.fromarray(decode_icon(character))
+
+def icon_atlas(names=ROSTER_NAMES):
+    # every icon for this name table, decoded once per process (shared with the simulator)
+    return shared_icon_atlas(names)
+
 def load_character_icon(character):
-    if character == "blank":
-        return Image.new("RGB", ICON_SIZE, color=(255, 255, 255))  # white blank
-
-    filename = f"{character}.png"
-    path = os.path.join("Stock Icons", filename)
-
-    try:
-        img = Image.open(path).convert("RGBA").resize(ICON_SIZE)
-    except Exception:
-        return Image.new("RGB", ICON_SIZE, color=(255, 255, 255))
-
-    # Extract RGB and alpha
-    rgb = img.convert("RGB")
-    alpha = img.getchannel("A")
-
-    # Calculate average RGB over visible (non-transparent) area
-    arr_rgb = np.array(rgb).astype(np.float32) / 255
-    arr_alpha = np.array(alpha).astype(np.float32) / 255
-    mean_rgb = np.sum(arr_rgb * arr_alpha[..., None], axis=(0, 1)) / (np.sum(arr_alpha) + 1e-5)
-    comp_rgb = 1.0 - mean_rgb
-    comp_color = tuple((comp_rgb * 255).astype(np.uint8))
-
-    # Composite over background
-    bg = Image.new("RGB", ICON_SIZE, color=comp_color)
-    out = Image.alpha_composite(bg.convert("RGBA"), img)
-    return out.convert("RGB")
-
-def add_transparent_rectangle(img: Image.Image, color=(255, 0, 0), alpha=0.4):
-    overlay = Image.new("RGB", ICON_SIZE, color=color)
-    blended = Image.blend(img, overlay, alpha)
-    return blended
-
-def plot_map(map=None, save=False, map_count=0, return_image=False, attacker=None, defender=None):
+    if character in ROSTER_NAMES:
+        return Image.fromarray(icon_atlas()[ROSTER_NAMES.index(character)])
+    return decode_character_icon(character)
+
+def add_transparent_rectangle(img: Image.Image, color=ATTACKER_COLOR, alpha=HIGHLIGHT_ALPHA):
+    return Image.fromarray(tint_tiles(np.array(img), color, alpha))
+
+def new_renderer():
+    return MapRenderer()
+
+def board_key(game_map, tile, viewport=None):
+    # the cells on screen and a key naming their pixels: the board's names, the hash of the visible grid
+    # and the level of detail
+    grid = game_map.grid
+    if viewport is not None:
+        top, left, rows, cols = viewport
+        grid = grid[top:top + rows, left:left + cols]
+    digest = hashlib.sha1(np.ascontiguousarray(grid).tobytes()).digest()
+    return grid, ("frame", tuple(game_map.names), grid.shape, digest, tile)
+
+class BoardCanvas:
+    # one board (or view of it) drawn by its own MapRenderer, kept so that selections are drawn on it in
+    # place with MapRenderer.highlight: a new highlight redraws only the old and new highlighted cells,
+    # found from the grid's cell index, and never copies or recomposes the frame. Shared between sessions
+    # through the cache, so hold lock while highlighting and using the frame.
+    def __init__(self, game_map, grid, tile):
+        self.renderer = MapRenderer(tile=tile)
+        with profiling.timer("plot_map.compose"):
+            self.renderer.render(game_map, grid=grid)
+        self.lock = threading.Lock()
+        # the frame, the renderer's grid and marks, and the cell index its first highlight builds
+        self.nbytes = self.renderer.frame.nbytes + grid.size * (grid.itemsize + 1 + 8)
+
+    def highlight(self, game_map, attacker=None, defender=None):
+        with profiling.timer("plot_map.highlight"):
+            return self.renderer.highlight(game_map, attacker, defender)
+
+def board_canvas(game_map, cache=None, tile=64, viewport=None):
+    grid, key = board_key(game_map, tile, viewport)
+    if cache is None:
+        return BoardCanvas(game_map, grid, tile)
+    return cache.get(("canvas",) + key, lambda: BoardCanvas(game_map, grid, tile))
+
+def board_frame(map, attacker=None, defender=None, cache=None, tile=64, viewport=None):
+    # the same pixels as plot_map, with no per-caller buffer. The unhighlighted frame of a board is
+    # composed once; a highlighted one is drawn on the board's BoardCanvas and kept as a copy. With a
+    # shared_resources.ResourceCache both are shared read-only between everyone showing this board.
+    # tile is the level of detail (pixels per cell) and viewport (top row, left column, rows, columns)
+    # limits drawing to that part of the board, so the frame is bounded by the screen, not the board.
+    game_map = as_map(map)
+    grid, key = board_key(game_map, tile, viewport)
+    get = (lambda key, build: build()) if cache is None else cache.get
+
+    def build_base():
+        with profiling.timer("plot_map.compose"):
+            return compose_frame(grid, overlay_atlas(game_map.names, tile))
+
+    if attacker is None and defender is None:
+        return get(key, build_base)
+
+    def build_highlight():
+        canvas = board_canvas(game_map, cache, tile, viewport)
+        with canvas.lock:
+            return canvas.highlight(game_map, attacker, defender).copy()
+
+    return get(key + (attacker, defender), build_highlight)
+
+class EncodedFrame:
+    # a board frame already encoded as PNG. It stands in for a PIL image where only .size and .save are
+    # used (streamlit_image_coordinates): saving writes the stored bytes instead of encoding again.
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size  # (width, height) like PIL
+        self.nbytes = len(data)
+
+    def save(self, fp, format="PNG", **params):
+        if format.upper() != "PNG":
+            raise ValueError(f"frame is stored as PNG, can't save it as {format}")
+        fp.write(self.data)
+
+def encoded_board_frame(map, attacker=None, defender=None, cache=None, encoded=None, tile=64, viewport=None):
+    # board_frame encoded as PNG by the render backend. With a ResourceCache as encoded, a board, view and
+    # highlight that has been shown before costs one hash: nothing is composed or encoded again.
+    game_map = as_map(map)
+    _, key = board_key(game_map, tile, viewport)
+
+    def encode(frame):
+        with profiling.timer("plot_map.encode"):
+            return EncodedFrame(get_backend().encode_png(frame), (frame.shape[1], frame.shape[0]))
+
+    def build():
+        if attacker is None and defender is None:
+            return encode(board_frame(game_map, cache=cache, tile=tile, viewport=viewport))
+        # a selection is encoded straight from the board's canvas, so nothing is copied for it
+        canvas = board_canvas(game_map, cache, tile, viewport)
+        with canvas.lock:
+            return encode(canvas.highlight(game_map, attacker, defender))
+
+    if encoded is None:
+        return build()
+    return encoded.get(("png",) + key + (attacker, defender), build)
+
+_renderer = new_renderer()
+_renderer_lock = threading.Lock()
+
+def plot_map(map=None, save=False, map_count=0, return_image=False, attacker=None, defender=None, renderer=None,
+             highlight_only=False):
+    # pass a renderer per Streamlit session; the shared default one is locked between threads.
+    # highlight_only: the board is the one the renderer drew last, only the selection moved
     if map is None:
         map = roster
-
-    grid_images = []
-    for row in map:
-        row_images = []
-        for char in row:
-            icon = load_character_icon(char)
-            if char == attacker:
-                icon = add_transparent_rectangle(icon, color=(255, 0, 0))  # red
-            elif char == defender:
-                icon = add_transparent_rectangle(icon, color=(0, 0, 255))  # blue
-            row_images.append(icon)
-        grid_images.append(row_images)
-
-    # Combine the rows into one final image
-    rows_combined = [Image.fromarray(np.hstack([np.array(img) for img in row])) for row in grid_images]
-    final_img = Image.fromarray(np.vstack([np.array(row) for row in rows_combined]))
+    with profiling.timer("plot_map.compose"):
+        if renderer is None:
+            with _renderer_lock:
+                draw = _renderer.highlight if highlight_only else _renderer.render
+                frame = draw(as_map(map), attacker=attacker, defender=defender).copy()
+        else:
+            draw = renderer.highlight if highlight_only else renderer.render
+            frame = draw(as_map(map), attacker=attacker, defender=defender)
 
     if save:
         if not os.path.exists("Maps"):
             os.makedirs("Maps")
         filename = f"Maps/map{map_count:03}.png"
-        final_img.save(filename)
+        with profiling.timer("plot_map.encode"):
+            get_backend().write_png(frame, filename)
 
     if return_image:
-        return final_img
\ No newline at end of file
+        return Image.fromarray(frame)
\ No newline at end of file
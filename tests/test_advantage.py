@@ -0,0 +1,43 @@
+# calculate_advantage_batch and the tables built from it against the scalar rules
+
+import numpy as np
+import pytest
+
+from map_generator import scaled_map
+from utils import advantage_table, calculate_advantage, calculate_advantage_batch, matchup_matrix
+
+COUNTS = np.arange(1, 301)
+
+
+def test_batch_matches_scalar_rules():
+    # every pair of counts up to 300: equal counts, diff == 4 and ratios of exactly 4 and 8 included
+    batch = calculate_advantage_batch(COUNTS[:, None], COUNTS[None, :])
+    expected = np.array([[calculate_advantage(a, d) for d in COUNTS.tolist()] for a in COUNTS.tolist()])
+    assert np.array_equal(batch, expected)
+
+
+@pytest.mark.parametrize("attacking, defending", [(5, 5), (9, 5), (5, 9), (3, 1), (1, 3), (4, 1), (8, 1),
+                                                   (16, 2), (7, 1), (31, 4), (300, 37), (300, 38)])
+def test_edge_cases(attacking, defending):
+    assert calculate_advantage_batch(attacking, defending) == calculate_advantage(attacking, defending)
+
+
+@pytest.mark.parametrize("attacking, defending", [(0, 5), (5, 0), (0, 0)])
+def test_zero_counts_raise(attacking, defending):
+    with pytest.raises(ZeroDivisionError):
+        calculate_advantage(attacking, defending)
+    with pytest.raises(ZeroDivisionError):
+        calculate_advantage_batch(np.array([1, attacking]), np.array([1, defending]))
+
+
+def test_table_and_matchup_matrix():
+    table = advantage_table(300)
+    assert np.array_equal(table[1:, 1:], calculate_advantage_batch(COUNTS[:, None], COUNTS[None, :]))
+    with pytest.raises(ValueError):
+        advantage_table(100_000)
+
+    game_map = scaled_map(30, 40, shuffle=True)
+    names, matrix = matchup_matrix(game_map)
+    counts = [game_map.ledger.count(game_map.id_of(name)) for name in names]
+    assert len(set(counts)) > 1
+    assert matrix.tolist() == [[calculate_advantage(a, d) for d in counts] for a in counts]
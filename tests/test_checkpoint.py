@@ -0,0 +1,26 @@
+# a game resumed from a checkpoint carries on exactly as if it had never stopped
+
+import numpy as np
+
+import main
+from checkpoint import load_checkpoint
+from frame_archive import load_archive
+
+
+def test_resumed_game_matches_the_uninterrupted_run(tmp_path):
+    main.main(render=False, verbose=False, seed=7, checkpoint_file=str(tmp_path / "full{round}.npz"),
+              checkpoint_every=40, archive_file=str(tmp_path / "full_archive.npz"))
+    main.main(render=False, verbose=False, resume_file=str(tmp_path / "full40.npz"),
+              checkpoint_file=str(tmp_path / "resumed.npz"), checkpoint_every=0,
+              archive_file=str(tmp_path / "resumed_archive.npz"))
+
+    resumed, rounds, _ = load_checkpoint(tmp_path / "resumed.npz")
+    uninterrupted, full_rounds, _ = load_checkpoint(tmp_path / f"full{rounds}.npz")
+    assert rounds == full_rounds > 40
+    assert np.array_equal(resumed.grid, uninterrupted.grid)
+
+    # the resumed archive numbers its rounds from the checkpoint, and each one is the uninterrupted board
+    full_history = load_archive(tmp_path / "full_archive.npz").history
+    history = load_archive(tmp_path / "resumed_archive.npz").history
+    assert (history.start_round, history.last_round) == (40, rounds)
+    assert all(np.array_equal(history.grid_at(r), full_history.grid_at(r)) for r in range(40, rounds + 1, 7))
@@ -0,0 +1,85 @@
+# archives are a GameHistory of the boards appended to them, read back exactly
+
+import random
+
+import numpy as np
+import pytest
+
+import main
+from character_roster import roster
+from frame_archive import FrameArchive, export_atlas, frame_runs, load_archive, save_archive
+from game_history import NO_PLAYER, GameHistory
+from game_map import Map, ROSTER_NAMES
+from icon_atlas import downsample_atlas, icon_atlas
+
+
+def played_game(seed, rounds=60):
+    game_map = Map.from_roster(roster)
+    rng = random.Random(seed)
+    archive = FrameArchive(game_map.names, keyframe_interval=16)
+    archive.append(game_map)
+    grids = [game_map.grid.copy()]
+    for _ in range(rounds):
+        game_map, over = main.step(game_map, simulate=True, rng=rng, verbose=False)
+        archive.append(game_map)
+        grids.append(game_map.grid.copy())
+        if over:
+            break
+    return archive, grids
+
+
+def test_frames_round_trip(tmp_path):
+    archive, grids = played_game(1)
+    assert archive.nbytes() < sum(grid.nbytes for grid in grids)
+    save_archive(archive, tmp_path / "game.npz")
+    loaded = load_archive(tmp_path / "game.npz")
+    assert len(loaded) == len(grids)
+    assert all(np.array_equal(frame, grid) for frame, grid in zip(loaded.frames(), grids))
+    assert all(np.array_equal(loaded[i], grids[i]) for i in range(len(grids)))
+
+
+def test_history_counts_rounds_from_its_start():
+    # a history resumed from a checkpoint numbers rounds like the game does
+    game_map = Map.from_roster(roster)
+    rng = random.Random(3)
+    history = GameHistory(game_map.grid, keyframe_interval=4, start_round=40)
+    grids = {40: game_map.grid.copy()}
+    for round_number in range(41, 51):
+        game_map, _ = main.step(game_map, simulate=True, rng=rng, verbose=False)
+        flipped = game_map.last_flipped
+        winner = game_map.grid.flat[flipped[0]] if len(flipped) else NO_PLAYER
+        history.record(NO_PLAYER, NO_PLAYER, winner, flipped, game_map.grid)
+        grids[round_number] = game_map.grid.copy()
+    assert (history.start_round, history.last_round, history.rounds) == (40, 50, 10)
+    assert all(np.array_equal(history.grid_at(r), grid) for r, grid in grids.items())
+    assert [r for r, _ in history.replay()] == list(range(40, 51))
+    assert np.array_equal(history.event(41)[3], history.events[0][3])
+    for outside in (39, 51):
+        with pytest.raises(IndexError):
+            history.grid_at(outside)
+    with pytest.raises(IndexError):
+        history.event(40)
+    assert GameHistory.from_arrays(history.to_arrays()).start_round == 40
+
+
+def test_unchanged_rounds_are_deduped():
+    game_map = Map.from_roster(roster)
+    archive = FrameArchive(game_map.names)
+    for _ in range(3):
+        archive.append(game_map)
+    assert frame_runs(archive) == [(0, 3)]
+    assert frame_runs(archive, dedupe=False) == [(0, 1), (1, 1), (2, 1)]
+
+
+def test_changes_with_several_new_owners_are_kept():
+    grid = np.array([[1, 2], [3, 0]], dtype=np.int16)
+    archive = FrameArchive(ROSTER_NAMES)
+    archive.append_grid(grid)
+    swapped = np.array([[2, 1], [3, 0]], dtype=np.int16)
+    archive.append_grid(swapped)
+    assert np.array_equal(archive[1], swapped)
+    assert np.array_equal(list(archive.frames())[-1], swapped)
+
+
+def test_export_atlas_uses_the_renderers_downsampling():
+    assert np.array_equal(export_atlas(ROSTER_NAMES, 0.25), downsample_atlas(icon_atlas(ROSTER_NAMES), 16))
@@ -0,0 +1,66 @@
+# the ledger, its sampler and the adjacency index are kept up to date by delta; after every change they must
+# still be what a fresh count of the board gives
+
+import random
+
+import numpy as np
+import pytest
+
+import main
+from character_roster import roster
+from game_map import BLANK_ID, AdjacencyIndex, Map
+from map_generator import tiled_map
+
+
+def check_indexes(game_map):
+    counts = np.bincount(game_map.grid.ravel(), minlength=len(game_map.names))
+    ledger = game_map.ledger
+    assert ledger.tiles == {p: int(n) for p, n in enumerate(counts) if p != BLANK_ID and n > 0}
+    assert game_map.adjacency.edges == AdjacencyIndex(game_map.grid).edges
+
+    # every k in [0, total) lands in one id's slice, and each id's slice is exactly its tile count wide
+    sampler = ledger.sampler
+    assert sampler.total == ledger.total()
+    found = np.bincount([sampler.find(k) for k in range(sampler.total)], minlength=len(counts))
+    expected = counts.copy()
+    expected[BLANK_ID] = 0
+    assert np.array_equal(found, expected)
+
+
+def play(game_map, seed, max_rounds):
+    rng = random.Random(seed)
+    check_indexes(game_map)
+    for _ in range(max_rounds):
+        game_map, over = main.step(game_map, simulate=True, rng=rng, verbose=False)
+        check_indexes(game_map)
+        if over:
+            break
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_roster_games(seed):
+    play(Map.from_roster(roster), seed, max_rounds=400)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_tiled_map_games(seed):
+    play(tiled_map(21, 29, shuffle=True, seed=seed), seed, max_rounds=150)
+
+
+def test_assign_from_several_owners_and_blank():
+    rng = np.random.default_rng(0)
+    game_map = tiled_map(15, 17, shuffle=True)
+    for _ in range(100):
+        cells = rng.choice(game_map.grid.size, int(rng.integers(1, 30)), replace=False)
+        rows, cols = np.divmod(cells, game_map.width)
+        game_map.assign(rows, cols, int(rng.integers(0, len(game_map.names))))
+        check_indexes(game_map)
+
+
+def test_rows_are_read_only():
+    game_map = Map.from_roster(roster)
+    assert game_map[0][0] == roster[0][0] and list(game_map[0]) == roster[0]
+    with pytest.raises(TypeError):
+        game_map[0][0] = roster[0][1]
+    with pytest.raises(TypeError):
+        next(iter(game_map))[0] = roster[0][1]
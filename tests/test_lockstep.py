@@ -0,0 +1,69 @@
+# the lockstep engine's conquests against utils.update_map, one game at a time
+
+import numpy as np
+import pytest
+
+import lockstep
+from game_map import Map
+from utils import squared_distance_to, update_map
+
+
+def boards(rng, games, height, width, players, block=1):
+    # block > 1 gives square territories, so many losers sit at the same distance from the winner
+    cells = rng.integers(0, players, (games, height // block + 1, width // block + 1))
+    return cells.repeat(block, axis=1).repeat(block, axis=2)[:, :height, :width].astype(np.int16)
+
+
+def battles(rng, grids):
+    # a winner, loser and tile count per game, between two players on its board
+    winners, losers, counts = [], [], []
+    for grid in grids:
+        present = np.unique(grid[grid != 0])
+        if len(present) < 2:
+            grid[0, 0], grid[-1, -1] = 1, 2
+            present = np.array([1, 2])
+        winner, loser = rng.choice(present, 2, replace=False)
+        winners.append(winner)
+        losers.append(loser)
+        counts.append(rng.choice([int((grid == loser).sum()), int(rng.integers(1, 80))]))
+    return np.array(winners, dtype=np.int64), np.array(losers, dtype=np.int64), np.array(counts)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("block", [1, 3])
+def test_conquer_matches_update_map(seed, block):
+    rng = np.random.default_rng(seed)
+    height, width = rng.integers(2, 30, 2)
+    grids = boards(rng, 6, height, width, int(rng.integers(3, 8)), block)
+    winners, losers, counts = battles(rng, grids)
+    names = ["blank"] + [f"P{i}" for i in range(1, int(grids.max()) + 1)]
+
+    expected = []
+    for grid, winner, loser, count in zip(grids, winners, losers, counts):
+        game_map = Map(grid.copy(), names)
+        update_map(game_map, names[winner], names[loser], int(count))
+        expected.append(game_map.grid)
+    n_lose = np.minimum(lockstep.lose_counts(counts), (grids == losers[:, None, None]).sum(axis=(1, 2)))
+    lockstep.conquer(grids, winners, losers, n_lose)
+    assert np.array_equal(grids, np.array(expected))
+
+
+def test_distances_match_squared_distance_to(monkeypatch):
+    # including a game with an empty mask, and a chunk bound small enough to split the queries
+    monkeypatch.setattr(lockstep, "DISTANCE_CHUNK_CELLS", 64)
+    rng = np.random.default_rng(0)
+    masks = rng.random((5, 17, 23)) < 0.05
+    masks[2] = False
+    games, rows, cols = np.nonzero(np.ones(masks.shape, dtype=bool))
+    distances = lockstep.squared_distance_batch(masks, games, rows, cols)
+    for game, mask in enumerate(masks):
+        mine = games == game
+        if mask.any():
+            assert np.array_equal(distances[mine], squared_distance_to(mask, rows[mine], cols[mine]))
+        else:
+            assert distances[mine].min() > 16 ** 2 + 22 ** 2
+
+
+def test_results_do_not_depend_on_the_batch():
+    together = lockstep.play_games(range(6), max_rounds=300)
+    assert together == [lockstep.play_games([seed], max_rounds=300)[0] for seed in range(6)]
@@ -0,0 +1,83 @@
+# recorders keep each session's switch and round breakdown apart; the histograms add up across threads
+
+import threading
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    profiling.reset()
+    yield
+    profiling.reset()
+
+
+def test_sessions_do_not_share_switch_or_rounds():
+    timing, quiet = profiling.Recorder(enabled=True), profiling.Recorder(enabled=False)
+    both_started = threading.Barrier(2)
+
+    def session(recorder, phase):
+        with profiling.recording(recorder):
+            profiling.start_round()
+            both_started.wait()
+            for _ in range(50):
+                with profiling.timer(phase):
+                    pass
+
+    threads = [threading.Thread(target=session, args=(timing, "a.phase")),
+               threading.Thread(target=session, args=(quiet, "b.phase"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(timing.last_round) == {"a.phase"}
+    assert quiet.last_round == {}
+    assert profiling.summary()["a.phase"]["count"] == 50
+    assert "b.phase" not in profiling.summary()
+
+
+def test_enable_only_switches_the_current_recorder():
+    session = profiling.Recorder(enabled=False)
+    before = profiling.is_enabled()
+    with profiling.recording(session):
+        profiling.enable()
+        assert profiling.is_enabled()
+    assert session.enabled
+    assert profiling.is_enabled() == before
+
+
+def test_counts_from_worker_threads_are_not_lost():
+    recorder = profiling.Recorder(enabled=True)
+
+    def work():
+        for _ in range(2000):
+            profiling.record("pool.png", 1e-6, recorder)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert profiling.summary()["pool.png"]["count"] == 16000
+
+
+def test_render_pool_times_composition():
+    from character_roster import roster
+    from game_map import Map
+    from visualisations import RenderPool
+
+    class Sink:
+        frames = 0
+
+        def push(self, img):
+            self.frames += 1
+
+    sink = Sink()
+    with profiling.recording(profiling.Recorder(enabled=True)):
+        with RenderPool(sink, workers=4, tile=4) as pool:
+            for _ in range(20):
+                pool.submit(Map.from_roster(roster))
+    assert sink.frames == 20
+    assert profiling.summary()["pool.compose"]["count"] == 20
@@ -0,0 +1,86 @@
+# every backend writes the same pixels for what plot_map draws, and the startup choice is cheap to repeat
+
+import os
+
+import numpy as np
+import pytest
+
+import render_backends
+import streamlit_visualisations
+import visualisations
+from character_roster import roster
+from game_map import Map
+
+BACKENDS = sorted(render_backends.available_backends())
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def restore_selection():
+    selected, selection = render_backends._selected, dict(render_backends.selection)
+    yield
+    render_backends._selected = selected
+    render_backends.selection.clear()
+    render_backends.selection.update(selection)
+
+
+def decoders():
+    return [backend for backend in render_backends.available_backends().values()
+            if backend.decode_png(backend.encode_png(np.zeros((2, 2, 3), dtype=np.uint8))) is not None]
+
+
+def saved_pixels(path):
+    # the PNG at path as read back by every backend that can decode, which must all agree
+    with open(path, "rb") as f:
+        data = f.read()
+    images = [decoder.decode_png(data) for decoder in decoders()]
+    assert all(np.array_equal(image, images[0]) for image in images)
+    return images[0]
+
+
+@pytest.mark.parametrize("attacker, defender", [(None, None), ("Mario", "Link")])
+def test_plot_map_writes_the_same_pixels_with_every_backend(tmp_path, monkeypatch, attacker, defender):
+    if not decoders():
+        pytest.skip("no backend here can read a PNG back")
+    monkeypatch.chdir(ROOT)  # the icons are read from "Stock Icons" here
+    game_map = Map.from_roster(roster)
+    drawn = visualisations.plot_map(game_map, return_image=True, attacker=attacker, defender=defender)
+    assert not np.array_equal(drawn, drawn[..., ::-1])  # in colour, so swapped channels would show
+    monkeypatch.chdir(tmp_path)
+    for count, name in enumerate(BACKENDS):
+        render_backends.select_backend(name)
+        visualisations.plot_map(game_map, save=True, map_count=count, attacker=attacker, defender=defender)
+        streamlit_visualisations.plot_map(game_map, save=True, map_count=100 + count,
+                                          attacker=attacker, defender=defender)
+        assert np.array_equal(saved_pixels(f"Maps/map{count:03}.png"), drawn), name
+        assert np.array_equal(saved_pixels(f"Maps/map{100 + count:03}.png"), drawn), name
+
+
+def test_selection_is_reused_from_the_cache_file(tmp_path, monkeypatch):
+    cache = tmp_path / "backend.json"
+    first = render_backends.select_backend(cache=str(cache))
+    assert not render_backends.selection["cached"]
+    assert set(render_backends.selection["seconds_per_frame"]) == set(BACKENDS)
+
+    def no_timing(*args):
+        raise AssertionError("a cached selection should not time the backends again")
+
+    monkeypatch.setattr(render_backends, "time_backend", no_timing)
+    assert render_backends.select_backend(cache=str(cache)) is first
+    assert render_backends.selection["cached"]
+
+
+def test_cache_from_other_versions_is_ignored(tmp_path):
+    cache = tmp_path / "backend.json"
+    render_backends.select_backend(cache=str(cache))
+    cache.write_text(cache.read_text().replace(render_backends.available_backends()[BACKENDS[0]].version, "old"))
+    render_backends.select_backend(cache=str(cache))
+    assert not render_backends.selection["cached"]
+
+
+def test_forced_backend_skips_the_benchmark(monkeypatch):
+    monkeypatch.setattr(render_backends, "time_backend", None)
+    assert render_backends.select_backend(BACKENDS[0]).name == BACKENDS[0]
+    assert render_backends.selection["forced"]
+    with pytest.raises(ValueError):
+        render_backends.select_backend("no such backend")
@@ -0,0 +1,69 @@
+# moving a highlight in place against drawing the board from scratch
+
+import io
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from character_roster import roster
+from game_map import Map
+from rendering import MapRenderer
+from shared_resources import ResourceCache
+from streamlit_visualisations import board_frame, encoded_board_frame
+from utils import update_map
+
+
+@pytest.fixture
+def game_map():
+    return Map.from_roster(roster)
+
+
+def players(game_map):
+    return [game_map.name_of(p) for p in game_map.players()]
+
+
+@pytest.mark.parametrize("tile", [64, 16, 4])
+def test_highlight_matches_render(game_map, tile):
+    rng = random.Random(tile)
+    names = players(game_map) + [None, "Nobody"]
+    moving = MapRenderer(tile=tile)
+    moving.render(game_map)
+    for _ in range(20):
+        attacker, defender = rng.choice(names), rng.choice(names)
+        expected = MapRenderer(tile=tile).render(game_map, attacker, defender)
+        assert np.array_equal(moving.highlight(game_map, attacker, defender), expected)
+
+
+def test_highlight_redraws_only_highlighted_cells(game_map):
+    renderer = MapRenderer(tile=8)
+    renderer.render(game_map)
+    attacker, defender = players(game_map)[:2]
+    renderer.highlight(game_map, attacker, defender)
+    owners = {game_map.grid[cell] for cell in renderer.changed_cells}
+    assert owners == {game_map.id_of(attacker), game_map.id_of(defender)}
+    assert len(renderer.changed_cells) == game_map.count(attacker) + game_map.count(defender)
+
+
+def test_highlight_after_the_board_changes(game_map):
+    renderer = MapRenderer(tile=8)
+    attacker, defender = players(game_map)[:2]
+    renderer.render(game_map, attacker, defender)
+    update_map(game_map, attacker, defender, game_map.count(defender))
+    renderer.render(game_map)
+    assert np.array_equal(renderer.highlight(game_map, attacker, None),
+                          MapRenderer(tile=8).render(game_map, attacker, None))
+
+
+def test_board_frame_and_encoded_frame_match_renderer(game_map):
+    cache, encoded = ResourceCache(), ResourceCache()
+    attacker, defender = players(game_map)[3:5]
+    viewport = (1, 2, 4, 6)
+    for a, d in ((attacker, defender), (None, None), (defender, attacker), (attacker, defender)):
+        view = Map(game_map.grid[1:5, 2:8].copy(), game_map.names)
+        expected = MapRenderer(tile=16).render(view, a, d)
+        assert np.array_equal(board_frame(game_map, a, d, cache=cache, tile=16, viewport=viewport), expected)
+        png = encoded_board_frame(game_map, a, d, cache=cache, encoded=encoded, tile=16, viewport=viewport)
+        assert np.array_equal(np.array(Image.open(io.BytesIO(png.data)).convert("RGB")), expected)
+    assert encoded.stats()["hits"] == 1
@@ -0,0 +1,59 @@
+# the exact solver against hand-checked boards, relabelling and its truncation bounds
+
+import numpy as np
+import pytest
+
+from game_map import Map, ROSTER_NAMES
+from solver import canonical, solve
+
+
+def board(rows):
+    return Map(np.array(rows, dtype=np.int16), ROSTER_NAMES)
+
+
+def test_two_tiles_coin_flip():
+    result = solve(board([[1, 2]]))
+    assert result["win_probability"] == {ROSTER_NAMES[1]: pytest.approx(0.5), ROSTER_NAMES[2]: pytest.approx(0.5)}
+    assert result["expected_rounds"] == pytest.approx(1.0)
+    assert result["unresolved"] == 0.0
+
+
+def test_finished_board():
+    result = solve(board([[3, 3], [0, 3]]))
+    assert result["win_probability"] == {ROSTER_NAMES[3]: 1.0}
+    assert result["expected_rounds"] == 0.0
+
+
+def test_separated_players_have_no_winner():
+    result = solve(board([[1, 0, 2]]))
+    assert result["win_probability"] == {ROSTER_NAMES[1]: 0.0, ROSTER_NAMES[2]: 0.0}
+
+
+def test_canonical_relabels_in_first_appearance_order():
+    grid, ids = canonical(np.array([[7, 0, 3], [3, 9, 7]], dtype=np.int16))
+    assert grid.tolist() == [[1, 0, 2], [2, 3, 1]]
+    assert ids.tolist() == [0, 7, 3, 9]
+
+
+@pytest.mark.parametrize("win_probability", [0.5, 0.7, lambda attacking, defending: 0.8 if attacking > defending else 0.4])
+def test_relabelled_boards_give_relabelled_odds(win_probability):
+    rows = [[1, 1, 2], [3, 2, 2], [3, 3, 0]]
+    swap = {1: 5, 2: 1, 3: 2, 0: 0}
+    first = solve(board(rows), win_probability)
+    second = solve(board([[swap[x] for x in row] for row in rows]), win_probability)
+    for old, new in swap.items():
+        if old:
+            assert second["win_probability"][ROSTER_NAMES[new]] == pytest.approx(first["win_probability"][ROSTER_NAMES[old]])
+    assert second["expected_rounds"] == pytest.approx(first["expected_rounds"])
+    assert sum(first["win_probability"].values()) == pytest.approx(1.0)
+
+
+def test_truncated_search_brackets_the_exact_odds():
+    game_map = board([[1, 1, 2, 2], [1, 3, 3, 2], [4, 4, 3, 2]])
+    exact = solve(game_map)
+    partial = solve(game_map, max_states=5, tolerance=1.0)
+    assert 0 < partial["unresolved"] < 1
+    for name, p in exact["win_probability"].items():
+        assert partial["win_probability"][name] - 1e-12 <= p <= partial["win_probability"][name] + partial["unresolved"] + 1e-12
+    with pytest.raises(ValueError):
+        solve(game_map, max_states=5)
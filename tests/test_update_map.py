@@ -0,0 +1,175 @@
+# update_map against the original list-of-lists implementation it replaced
+
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from character_roster import roster
+from game_map import Map
+from utils import update_map
+
+
+def reference_update_map(map, winner, loser, losing_player_count=1):
+    # utils.update_map before the distance transform, kept verbatim as the reference
+    height = len(map)
+    width = len(map[0]) if height > 0 else 0
+
+    # Determine how many loser tiles to replace
+    if losing_player_count < 16:
+        players_to_lose = losing_player_count
+    elif losing_player_count < 32:
+        players_to_lose = losing_player_count // 2
+    else:
+        players_to_lose = losing_player_count // 4
+
+    # Get coordinates of winner and loser tiles
+    winner_coords = [(i, j) for i in range(height) for j in range(width) if map[i][j] == winner]
+    loser_coords = [(i, j) for i in range(height) for j in range(width) if map[i][j] == loser]
+
+    if not winner_coords or not loser_coords:
+        return map  # Nothing to do
+
+    # Compute distance from each loser to the nearest winner
+    def min_distance_to_winner(loser_pos):
+        li, lj = loser_pos
+        return min((li - wi) ** 2 + (lj - wj) ** 2 for wi, wj in winner_coords)  # squared distance
+
+    # Sort loser positions by proximity to winners
+    loser_coords.sort(key=min_distance_to_winner)
+
+    # Replace closest losers
+    for i, j in loser_coords[:players_to_lose]:
+        map[i][j] = winner
+
+    return map
+
+
+def check(board, winner, loser, losing_player_count):
+    # both the list-of-lists and the Map path give the reference result
+    expected = reference_update_map(copy.deepcopy(board), winner, loser, losing_player_count)
+    as_lists = copy.deepcopy(board)
+    assert update_map(as_lists, winner, loser, losing_player_count) == expected
+    game_map = Map.from_roster(board)
+    update_map(game_map, winner, loser, losing_player_count)
+    assert game_map.to_roster() == expected
+
+
+def random_board(rng, height, width, players):
+    names = ["blank"] + [f"P{i}" for i in range(1, players)]
+    return [[rng.choice(names) for _ in range(width)] for _ in range(height)]
+
+
+def blocky_board(rng, height, width, players, block):
+    # square territories, so many losers sit at the same distance from the winner
+    names = ["blank"] + [f"P{i}" for i in range(1, players)]
+    blocks = [[rng.choice(names) for _ in range(width // block + 1)] for _ in range(height // block + 1)]
+    return [[blocks[i // block][j // block] for j in range(width)] for i in range(height)]
+
+
+def battles(rng, board, n):
+    players = sorted({name for row in board for name in row} - {"blank"})
+    for _ in range(n):
+        if len(players) < 2:
+            return
+        winner, loser = rng.sample(players, 2)
+        count = sum(row.count(loser) for row in board)
+        yield winner, loser, rng.choice([count, rng.randint(1, 80)])
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_boards(seed):
+    rng = random.Random(seed)
+    board = random_board(rng, rng.randint(1, 20), rng.randint(1, 20), rng.randint(2, 8))
+    for winner, loser, count in battles(rng, board, 5):
+        check(board, winner, loser, count)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_blocky_boards(seed):
+    rng = random.Random(seed)
+    board = blocky_board(rng, rng.randint(4, 30), rng.randint(4, 30), rng.randint(2, 6), rng.randint(2, 5))
+    for winner, loser, count in battles(rng, board, 5):
+        check(board, winner, loser, count)
+
+
+def test_roster_board_game():
+    # a whole game on the shipped board, every battle checked
+    rng = random.Random(0)
+    board = copy.deepcopy(roster)
+    for _ in range(200):
+        players = sorted({name for row in board for name in row} - {"blank"})
+        if len(players) < 2:
+            break
+        winner, loser = rng.sample(players, 2)
+        count = sum(row.count(loser) for row in board)
+        check(board, winner, loser, count)
+        reference_update_map(board, winner, loser, count)
+
+
+def test_distance_ties_break_row_major():
+    # every loser is at squared distance 1 or 2 from the single winner tile
+    board = [["L", "L", "L"],
+             ["L", "W", "L"],
+             ["L", "L", "L"]]
+    for count in range(1, 9):
+        check(board, "W", "L", count)
+    board = copy.deepcopy(board)
+    update_map(board, "W", "L", 2)
+    assert board == [["L", "W", "L"],
+                     ["W", "W", "L"],
+                     ["L", "L", "L"]]
+
+
+def test_ties_between_distant_winner_tiles():
+    board = [["W", "L", "L", "L", "W"],
+             ["L", "L", "L", "L", "L"],
+             ["W", "L", "L", "L", "W"]]
+    for count in range(1, 12):
+        check(board, "W", "L", count)
+
+
+@pytest.mark.parametrize("count", [11, 12, 50, 1000])
+def test_more_to_lose_than_loser_tiles(count):
+    board = [["W", "L", "L"],
+             ["L", "blank", "L"],
+             ["L", "L", "L"]]  # 7 loser tiles
+    check(board, "W", "L", count)
+    board = copy.deepcopy(board)
+    update_map(board, "W", "L", count)
+    assert sum(row.count("L") for row in board) == max(0, 7 - (count if count < 16 else count // 2 if count < 32 else count // 4))
+
+
+@pytest.mark.parametrize("count", [0, 1, 14, 15, 16, 17, 30, 31, 32, 33, 35, 36, 63, 64])
+def test_losing_count_thresholds(count):
+    rng = random.Random(count)
+    board = blocky_board(rng, 12, 12, 3, 3)
+    board[0][0], board[11][11] = "W", "L"
+    board = [["W" if name == "P1" else "L" if name == "P2" else name for name in row] for row in board]
+    check(board, "W", "L", count)
+
+
+def test_names_not_on_board():
+    board = [["W", "L"], ["L", "blank"]]
+    check(board, "W", "Nobody", 3)
+    check(board, "Nobody", "L", 3)
+    check(board, "W", "blank", 1)
+
+
+def test_large_board_matches_reference():
+    rng = random.Random(7)
+    board = blocky_board(rng, 60, 80, 5, 7)
+    for winner, loser, count in battles(rng, board, 3):
+        check(board, winner, loser, count)
+
+
+def test_last_flipped_are_the_changed_cells():
+    rng = random.Random(3)
+    board = blocky_board(rng, 20, 20, 4, 4)
+    game_map = Map.from_roster(board)
+    before = game_map.grid.copy()
+    winner, loser, count = next(battles(rng, board, 1))
+    update_map(game_map, winner, loser, count)
+    changed = np.flatnonzero(before.ravel() != game_map.grid.ravel())
+    assert sorted(game_map.last_flipped.tolist()) == changed.tolist()
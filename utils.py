@@ -30,37 +30,126 @@ def calculate_advantage(attacking_player_count, defending_player_count):
         return -advantage
 
 import numpy as np
+from functools import lru_cache
+from game_map import Map, as_map
 
-def update_map(map, winner, loser, losing_player_count=1):
-    height = len(map)
-    width = len(map[0]) if height > 0 else 0
+def calculate_advantage_batch(attacking_player_count, defending_player_count):
+    # calculate_advantage over whole arrays of counts (broadcast together), same rules and edge cases
+    attacking, defending = np.broadcast_arrays(np.asarray(attacking_player_count), np.asarray(defending_player_count))
+    bigger_player = np.where(attacking > defending, attacking, defending)
+    smaller_player = np.where(bigger_player == attacking, defending, attacking)
+    if np.any(smaller_player == 0):
+        raise ZeroDivisionError("player counts must be non-zero")
+    diff = bigger_player - smaller_player
+    advantage = np.where(diff >= 4, 10, 0)
+    scale = np.floor(bigger_player / smaller_player)
+    advantage = np.where((scale >= 4) & (scale < 8), 20, advantage)
+    advantage = np.where(scale >= 8, 30, advantage)
+    return np.where(attacking > defending, advantage, -advantage)
+
+# the table is (n+1)^2 bytes; it is an opt-in lookup for hot loops over small boards, everything else
+# should call calculate_advantage_batch on the counts it has
+ADVANTAGE_TABLE_MAX = 1024
+# rows of the table computed at once, so the intermediate arrays stay a few MB
+ADVANTAGE_TABLE_CHUNK_ROWS = 64
+
+@lru_cache(maxsize=1)
+def advantage_table(max_count):
+    # table[attacking, defending] for every count up to max_count; row and column 0 are unused (0)
+    if max_count > ADVANTAGE_TABLE_MAX:
+        raise ValueError(f"advantage_table is capped at {ADVANTAGE_TABLE_MAX} tiles, got {max_count}")
+    counts = np.arange(1, max_count + 1, dtype=np.int32)
+    table = np.zeros((max_count + 1, max_count + 1), dtype=np.int8)
+    for start in range(0, max_count, ADVANTAGE_TABLE_CHUNK_ROWS):
+        rows = counts[start:start + ADVANTAGE_TABLE_CHUNK_ROWS]
+        table[rows[0]:rows[-1] + 1, 1:] = calculate_advantage_batch(rows[:, None], counts[None, :])
+    table.flags.writeable = False
+    return table
 
+def matchup_matrix(map):
+    # advantage of every live player (rows, attacking) against every other (columns, defending)
+    game_map = as_map(map)
+    players = game_map.players()
+    counts = np.array([game_map.ledger.count(p) for p in players])
+    return [game_map.name_of(p) for p in players], calculate_advantage_batch(counts[:, None], counts[None, :])
+
+def players_to_lose_for(losing_player_count):
     # Determine how many loser tiles to replace
     if losing_player_count < 16:
-        players_to_lose = losing_player_count
+        return losing_player_count
     elif losing_player_count < 32:
-        players_to_lose = losing_player_count // 2
+        return losing_player_count // 2
     else:
-        players_to_lose = losing_player_count // 4
+        return losing_player_count // 4
 
-    # Get coordinates of winner and loser tiles
-    winner_coords = [(i, j) for i in range(height) for j in range(width) if map[i][j] == winner]
-    loser_coords = [(i, j) for i in range(height) for j in range(width) if map[i][j] == loser]
+# losers are processed in chunks so the (losers x columns) distance block stays bounded
+DISTANCE_CHUNK_CELLS = 1 << 20
 
-    if not winner_coords or not loser_coords:
-        return map  # Nothing to do
+def vertical_distance(mask):
+    # distance from each cell to the nearest True cell in the same column;
+    # columns with no True cell get a value larger than any real 2-D distance
+    height, width = mask.shape
+    far = height + width
+    rows = np.arange(height)[:, None]
+    above = np.maximum.accumulate(np.where(mask, rows, -far), axis=0)
+    below = np.minimum.accumulate(np.where(mask, rows, height + far)[::-1], axis=0)[::-1]
+    return np.minimum(rows - above, below - rows).astype(np.int64)
 
-    # Compute distance from each loser to the nearest winner
-    def min_distance_to_winner(loser_pos):
-        li, lj = loser_pos
-        return min((li - wi) ** 2 + (lj - wj) ** 2 for wi, wj in winner_coords)  # squared distance
+def squared_distance_to(mask, rows, cols):
+    # exact squared Euclidean distance from each (row, col) to the nearest True cell of mask.
+    # Separable distance transform: a vertical pass over the whole grid, then for each
+    # query cell a min over the columns that actually contain a True cell.
+    vertical = vertical_distance(mask)
+    source_cols = np.flatnonzero(mask.any(axis=0))
+    vertical_sq = vertical[:, source_cols] ** 2
 
-    # Sort loser positions by proximity to winners
-    loser_coords.sort(key=min_distance_to_winner)
+    distances = np.empty(len(rows), dtype=np.int64)
+    chunk = max(1, DISTANCE_CHUNK_CELLS // max(len(source_cols), 1))
+    for start in range(0, len(rows), chunk):
+        r = rows[start:start + chunk]
+        c = cols[start:start + chunk]
+        horizontal_sq = (c[:, None] - source_cols[None, :]) ** 2
+        distances[start:start + chunk] = (vertical_sq[r] + horizontal_sq).min(axis=1)
+    return distances
 
-    # Replace closest losers
-    for i, j in loser_coords[:players_to_lose]:
-        map[i][j] = winner
+def closest_cells(distances, flat_indices, n):
+    # positions of the n smallest distances. Ties are broken by flat (row-major) index,
+    # i.e. top-to-bottom then left-to-right, the same order a stable sort of the
+    # row-major tile list gives. Returned nearest first.
+    keys = distances * (int(flat_indices.max()) + 1) + flat_indices
+    if n < len(keys):
+        keys_part = np.argpartition(keys, n - 1)[:n]
+    else:
+        keys_part = np.arange(len(keys))
+    return keys_part[np.argsort(keys[keys_part])]
 
-    return map
+def update_map(map, winner, loser, losing_player_count=1):
+    # list-of-lists maps are converted, updated, and written back in place
+    game_map = as_map(map)
+    # names that aren't on the board hold no tiles, so there is nothing to do, as before
+    winner_id = game_map.ids.get(winner)
+    loser_id = game_map.ids.get(loser)
+    players_to_lose = players_to_lose_for(losing_player_count)
+    if winner_id is None or loser_id is None:
+        game_map.last_flipped = np.empty(0, dtype=np.intp)
+        return map
+
+    winner_mask = game_map.grid == winner_id
+    loser_flat = np.flatnonzero(game_map.grid == loser_id)
+
+    if players_to_lose <= 0 or len(loser_flat) == 0 or not winner_mask.any():
+        game_map.last_flipped = loser_flat[:0]
+        return map  # Nothing to do
+
+    # Squared distance from each loser to the nearest winner, then the closest few
+    loser_rows, loser_cols = np.divmod(loser_flat, game_map.width)
+    distances = squared_distance_to(winner_mask, loser_rows, loser_cols)
+    chosen = closest_cells(distances, loser_flat, players_to_lose)
+    rows, cols = loser_rows[chosen], loser_cols[chosen]
 
+    # Replace closest losers
+    game_map.assign(rows, cols, winner_id)
+    if not isinstance(map, Map):
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            map[i][j] = winner
+    return map
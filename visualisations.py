@@ -1,73 +1,74 @@
-import matplotlib
-matplotlib.use('TKAgg')
-import matplotlib.pyplot as plt
 from character_roster import roster
+from game_map import as_map, ROSTER_NAMES
+from icon_atlas import ICON_SIZE, compose_frame, decode_icon, icon_atlas as shared_icon_atlas
+from rendering import MapRenderer, overlay_atlas, tint_tiles
+from render_backends import get_backend
+import profiling
+from concurrent.futures import ThreadPoolExecutor
 import cv2
+import itertools
 import numpy as np
 import os
-def load_character_icon(character):
-    if character == "blank":
-        return np.zeros((64, 64, 3), dtype=np.uint8)
+import queue
+import sys
+import threading
 
-    filename = f"{character}.png"
-    path = "Stock Icons/" + filename
-    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)  # Load as RGBA
+# matplotlib is only imported when something is shown on screen. In headless mode
+# (SMASH_HEADLESS=1 or set_headless()) it is never given a window: batch and server use
+headless = os.environ.get("SMASH_HEADLESS") == "1"
 
-    if img is None or img.shape[2] != 4:
-        return np.zeros((64, 64, 3), dtype=np.uint8)
+def set_headless(on=True):
+    global headless
+    headless = on
 
-    rgba = img.astype(np.float32) / 255.0
-    rgb = rgba[..., :3]
-    alpha = rgba[..., 3:]
+def has_display():
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
 
-    # Compute average visible RGB color
-    mean_rgb = np.sum(rgb * alpha, axis=(0, 1)) / (np.sum(alpha) + 1e-5)
-    comp_rgb = 1.0 - mean_rgb  # Complement color
+def can_show():
+    return not headless and has_display()
 
-    # Create background with complementary color
-    bg = np.ones_like(rgb) * comp_rgb
+def get_pyplot():
+    import matplotlib
+    if "matplotlib.pyplot" not in sys.modules:
+        matplotlib.use('TKAgg' if can_show() else 'Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
-    # Alpha blend: result = alpha * fg + (1 - alpha) * bg
-    blended = alpha * rgb + (1 - alpha) * bg
-    blended = (blended * 255).astype(np.uint8)
+def icon_atlas(names=ROSTER_NAMES):
+    # every icon for this name table, decoded once per process (shared with the web app)
+    return shared_icon_atlas(names)
 
-    # Convert to BGR for OpenCV
-    blended = cv2.cvtColor(blended, cv2.COLOR_RGB2BGR)
-    return blended
+def load_character_icon(character):
+    if character in ROSTER_NAMES:
+        return icon_atlas()[ROSTER_NAMES.index(character)].copy()
+    return decode_icon(character)
 
 def add_transparent_rectangle(img, color):
-    # Initialize blank mask image of same dimensions for drawing the shapes
-    shapes = np.zeros_like(img, np.uint8)
-
-    # Draw shapes
-    cv2.rectangle(shapes, (0, 0), (64, 64), color, cv2.FILLED)
-
-    # Generate output by blending image with shapes image, using the shapes
-    # images also as mask to limit the blending to those parts
-    out = img.copy()
-    alpha = 0.5
-    mask = shapes.astype(bool)
-    out[mask] = cv2.addWeighted(img, alpha, shapes, 1 - alpha, 0)[mask]
-    return out
-
-def plot_map(map=None, save=False, map_count=0, show=False, return_image=False, attacker=None, defender=None):
-    imgs = []
+    return tint_tiles(img, color)
+
+def new_renderer(tile=ICON_SIZE):
+    return MapRenderer(tile=tile)
+
+# keeps the previous frame, so consecutive plot_map calls only redraw changed cells
+renderer = new_renderer()
+
+def set_tile(tile):
+    # draw plot_map's frames at tile x tile pixels per cell (see icon_atlas.LOD_TILE_SIZES)
+    global renderer
+    renderer = new_renderer(tile)
+
+def plot_map(map=None, save=False, map_count=0, show=False, return_image=False, attacker=None, defender=None,
+             highlight_only=False):
+    # highlight_only: the board is the one drawn last, only the attacker/defender selection moved,
+    # so just the highlighted cells are redrawn
     if map is None:
         map = roster
-    for line in map:
-        imgs_line = []
-        for character in line:
-            img = load_character_icon(character)
-            if character == attacker:
-                img = add_transparent_rectangle(img, (255, 0, 0))
-                # cv2.rectangle(img, (0, 0), (64, 64), (255, 0, 0), -1)  # Red border
-            if character == defender:
-                img = add_transparent_rectangle(img, (0, 0, 255))
-                # cv2.rectangle(img, (0, 0), (64, 64), (0, 0, 255), -1)  # Blue border
-            imgs_line.append(img)
-        imgs.append(np.concatenate(imgs_line, axis=1))
-
-    img = np.concatenate(imgs, axis=0)
+    with profiling.timer("plot_map.compose"):
+        draw = renderer.highlight if highlight_only else renderer.render
+        img = draw(as_map(map), attacker=attacker, defender=defender)
+
     # print(img.shape)
     if save:
         if not os.path.exists("Maps"):
@@ -76,37 +77,57 @@ def plot_map(map=None, save=False, map_count=0, show=False, return_image=False,
             map_count = f"00{map_count}"
         elif map_count < 100:
             map_count = f"0{map_count}"
-        cv2.imwrite(f"Maps/map{map_count}.png", img)
-    if show:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        with profiling.timer("plot_map.encode"):
+            get_backend().write_png(img, f"Maps/map{map_count}.png")
+    if show and can_show():
+        plt = get_pyplot()
         plt.figure(figsize=(10, 10))
-        plt.imshow(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        plt.imshow(img)
         plt.axis('off')
         plt.show()
     if return_image:
-        return img
+        return img.copy()
     # return img
 
-def plot_map_animation():
-    folder = "Maps"
-    images = []
-
-    # Load images in sorted order
+def read_saved_maps(folder="Maps"):
+    # yields the saved PNG frames (RGB) one at a time, in sorted order
     for filename in sorted(os.listdir(folder)):
         if filename.endswith(".png"):
-            filepath = os.path.join(folder, filename)
-            img = cv2.imread(filepath)
+            img = cv2.imread(os.path.join(folder, filename))
             if img is not None:
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                images.append(img_rgb)
+                yield img[..., ::-1]
+
+def read_video(video_file):
+    # yields the frames (RGB) of a recorded video one at a time
+    capture = cv2.VideoCapture(video_file)
+    try:
+        while True:
+            ok, img = capture.read()
+            if not ok:
+                return
+            yield img[..., ::-1]
+    finally:
+        capture.release()
+
+def plot_map_animation(folder="Maps", video=None):
+    # plays back the saved PNGs, or a video recorded with FrameRecorder, one frame in memory at a time
+    frames = read_video(video) if video is not None else read_saved_maps(folder)
+    if not can_show():
+        print("No display available, skipping the animation.")
+        return
+    first = next(frames, None)
+    if first is None:
+        print("No images found.")
+        return
 
     # Display with a single figure and axis
+    plt = get_pyplot()
     plt.ion()
     fig, ax = plt.subplots(figsize=(10, 10))
-    img_display = ax.imshow(images[0])
+    img_display = ax.imshow(first)
     ax.axis('off')
 
-    for img in images:
+    for img in itertools.chain([first], frames):
         img_display.set_data(img)
         fig.canvas.draw()
         fig.canvas.flush_events()
@@ -115,32 +136,114 @@ def plot_map_animation():
     plt.ioff()
     plt.show()
 
-from matplotlib.animation import FFMpegWriter
-
-def plot_map_animation_to_mp4(output_file="map_animation_cv2.mp4", fps=10):
-    folder = "Maps"
-    images = []
-
-    # Load and convert all images
-    for filename in sorted(os.listdir(folder)):
-        if filename.endswith(".png"):
-            print(filename)
-            filepath = os.path.join(folder, filename)
-            img = cv2.imread(filepath)
-            if img is not None:
-                images.append(img)
-
-    if not images:
-        print("No images found.")
-        return
-
-    height, width, _ = images[0].shape
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for MP4
-    writer = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
-
-    for img in images:
-        resized_img = cv2.resize(img, (width, height))  # Ensure consistent size
-        writer.write(resized_img)
+class FrameRecorder:
+    # streams RGB frames straight into a cv2.VideoWriter as the game is played,
+    # so memory stays constant however long the game runs. PNGs are an optional side output.
+    def __init__(self, output_file="map_animation_cv2.mp4", fps=10, png_folder=None):
+        self.output_file = output_file
+        self.fps = fps
+        self.png_folder = png_folder
+        self.writer = None
+        self.size = None
+        self.count = 0
+
+    def push(self, img):
+        if self.writer is None:
+            height, width, _ = img.shape
+            self.size = (width, height)
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for MP4
+            self.writer = cv2.VideoWriter(self.output_file, fourcc, self.fps, self.size)
+        if (img.shape[1], img.shape[0]) != self.size:
+            img = cv2.resize(img, self.size)  # Ensure consistent size
+        with profiling.timer("recorder.video"):
+            self.writer.write(np.ascontiguousarray(img[..., ::-1]))  # the writer wants BGR
+
+        if self.png_folder is not None:
+            if not os.path.exists(self.png_folder):
+                os.makedirs(self.png_folder)
+            with profiling.timer("recorder.png"):
+                get_backend().write_png(img, os.path.join(self.png_folder, f"map{self.count:03}.png"))
+        self.count += 1
+
+    def close(self):
+        if self.writer is None:
+            print("No images found.")
+            return
+        self.writer.release()
+        self.writer = None
+        print(f"Video saved to: {self.output_file}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class RenderPool:
+    # renders (and optionally PNG-encodes) map snapshots on worker threads so the simulation
+    # doesn't wait for them. A writer thread hands finished frames to sink.push() strictly in
+    # submission order. At most max_pending frames are queued: submit() blocks past that.
+    def __init__(self, sink, workers=None, max_pending=None, png_folder=None, tile=ICON_SIZE):
+        workers = workers or os.cpu_count() or 1
+        self.sink = sink
+        self.tile = tile
+        self.png_folder = png_folder
+        if png_folder is not None and not os.path.exists(png_folder):
+            os.makedirs(png_folder)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.queue = queue.Queue(maxsize=max_pending or 2 * workers)
+        self.error = None
+        self.count = 0
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+    def submit(self, map):
+        game_map = as_map(map)
+        if self.error is not None:
+            raise self.error
+        # the grid is copied, so the game can keep playing while this frame renders
+        future = self.executor.submit(self._render, game_map.grid.copy(), game_map.names, self.count,
+                                      profiling.current())
+        self.queue.put(future)
+        self.count += 1
+
+    def _render(self, grid, names, index, recorder):
+        # timed into the recorder of whoever submitted the frame
+        with profiling.recording(recorder):
+            with profiling.timer("pool.compose"):
+                img = compose_frame(grid, overlay_atlas(names, self.tile))
+            if self.png_folder is not None:
+                with profiling.timer("pool.png"):
+                    get_backend().write_png(img, os.path.join(self.png_folder, f"map{index:03}.png"))
+        return img
 
-    writer.release()
-    print(f"Video saved to: {output_file}")
\ No newline at end of file
+    def _write(self):
+        while True:
+            future = self.queue.get()
+            if future is None:
+                return
+            try:
+                img = future.result()
+                if self.error is None:
+                    self.sink.push(img)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        self.executor.shutdown()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def plot_map_animation_to_mp4(output_file="map_animation_cv2.mp4", fps=10, folder="Maps"):
+    # re-encodes frames already saved in Maps/, streaming them through a FrameRecorder
+    with FrameRecorder(output_file, fps=fps) as recorder:
+        for img in read_saved_maps(folder):
+            recorder.push(img)